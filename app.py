@@ -3,146 +3,240 @@
 # -------------------------------------------------------
 
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
-import requests
-import random
+import numpy as np
+import aiohttp
+import httpx
+import orjson
+import asyncio
 import os
 import time
-from groq import Groq
+import threading
+from streamlit_autorefresh import st_autorefresh
 from dotenv import load_dotenv
-from chatbot import vayu_chatbot_ui
-from heatmap_openweather import heatmap_ui_openweather
 
-load_dotenv()  # load .env if available
+
+@st.cache_resource(show_spinner=False)
+def _init_env():
+    """Load .env once per process and snapshot the keys the app reads."""
+    load_dotenv()  # load .env if available
+    return (
+        os.getenv("WHATSAPP_TOKEN"),
+        os.getenv("WHATSAPP_PHONE_ID"),
+        os.getenv("WHATSAPP_TO"),
+        os.getenv("GROQ_API_KEY"),
+    )
+
 
 # -------------------------------------------------------
 # CONFIG
 # -------------------------------------------------------
 st.set_page_config(page_title="NoVac — Air Quality Copilot", layout="wide")
+_init_env()  # .env is read on the first run only; other modules see it via os.environ
 
 
 # -------------------------------------------------------
 # UI HELPERS (CSS + PARTICLES)
 # -------------------------------------------------------
-def load_css():
+_FALLBACK_CSS = """
+body { background: #020617; color: #e5e7eb; }
+.main-title { font-size: 1.6rem; font-weight: 700; display:flex; gap:0.5rem; align-items:center; }
+.logo-dot { width:12px; height:12px; border-radius:999px; background:linear-gradient(135deg,#22d3ee,#a855f7); box-shadow:0 0 12px #22d3ee; display:inline-block; }
+.nv-pill { padding:0.4rem 0.9rem; border-radius:999px; border:1px solid rgba(148,163,184,0.5); font-size:0.8rem; display:flex; gap:0.35rem; align-items:center; background:rgba(15,23,42,0.85); }
+.nv-card { background:rgba(15,23,42,0.9); border-radius:1.2rem; padding:1.0rem 1.1rem; border:1px solid rgba(148,163,184,0.35); box-shadow:0 18px 40px rgba(15,23,42,0.8); margin-bottom:0.9rem; }
+.nv-card-header { font-size:0.85rem; letter-spacing:0.08em; text-transform:uppercase; color:#9ca3af; margin-bottom:0.6rem; }
+.ai-thinking { display:flex; align-items:center; gap:0.5rem; font-size:0.85rem; color:#a5b4fc; }
+.ai-dot { width:8px; height:8px; border-radius:999px; background:linear-gradient(135deg,#22c55e,#22d3ee); box-shadow:0 0 10px #22d3ee; animation:pulse 1.4s infinite; }
+.autonomous-badge { background: linear-gradient(135deg, #22c55e, #22d3ee); color: white; padding: 0.3rem 0.8rem; border-radius: 1rem; font-size: 0.8rem; font-weight: bold; animation: pulse 2s infinite; }
+@keyframes pulse {
+    0% { transform:scale(1); opacity:1; }
+    50% { transform:scale(1.05); opacity:0.8; }
+    100% { transform:scale(1); opacity:1; }
+}
+"""
+
+
+@st.cache_data(show_spinner=False)
+def _read_or_fallback(path, fallback):
+    # Cached: app.py re-executes on every rerun, the files don't change
     try:
-        with open("style.css") as f:
-            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+        with open(path) as f:
+            return f.read()
     except FileNotFoundError:
-        # Fallback simple style if file missing
-        st.markdown(
-            """
-            <style>
-            body { background: #020617; color: #e5e7eb; }
-            .main-title { font-size: 1.6rem; font-weight: 700; display:flex; gap:0.5rem; align-items:center; }
-            .logo-dot { width:12px; height:12px; border-radius:999px; background:linear-gradient(135deg,#22d3ee,#a855f7); box-shadow:0 0 12px #22d3ee; display:inline-block; }
-            .nv-pill { padding:0.4rem 0.9rem; border-radius:999px; border:1px solid rgba(148,163,184,0.5); font-size:0.8rem; display:flex; gap:0.35rem; align-items:center; background:rgba(15,23,42,0.85); }
-            .nv-card { background:rgba(15,23,42,0.9); border-radius:1.2rem; padding:1.0rem 1.1rem; border:1px solid rgba(148,163,184,0.35); box-shadow:0 18px 40px rgba(15,23,42,0.8); margin-bottom:0.9rem; }
-            .nv-card-header { font-size:0.85rem; letter-spacing:0.08em; text-transform:uppercase; color:#9ca3af; margin-bottom:0.6rem; }
-            .ai-thinking { display:flex; align-items:center; gap:0.5rem; font-size:0.85rem; color:#a5b4fc; }
-            .ai-dot { width:8px; height:8px; border-radius:999px; background:linear-gradient(135deg,#22c55e,#22d3ee); box-shadow:0 0 10px #22d3ee; animation:pulse 1.4s infinite; }
-            .autonomous-badge { background: linear-gradient(135deg, #22c55e, #22d3ee); color: white; padding: 0.3rem 0.8rem; border-radius: 1rem; font-size: 0.8rem; font-weight: bold; animation: pulse 2s infinite; }
-            @keyframes pulse {
-                0% { transform:scale(1); opacity:1; }
-                50% { transform:scale(1.05); opacity:0.8; }
-                100% { transform:scale(1); opacity:1; }
-            }
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
+        return fallback
+
+
+_CSS_HTML = f"<style>{_read_or_fallback('style.css', _FALLBACK_CSS)}</style>"
+# Optional particle background layer if particles.html exists
+_PARTICLES_HTML = _read_or_fallback("particles.html", "")
+
+_HEADER_HTML = """
+<div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:0.8rem;">
+    <div class="main-title">
+        <span class="logo-dot"></span>
+        <span>NoVac — Air Quality Copilot</span>
+    </div>
+    <div class="nv-pill">
+        <span>🧠 Agentic AI</span>
+        <span>·</span>
+        <span>📊 Live AQI & Pollutants</span>
+        <span>·</span>
+        <span>📲 WhatsApp Alerts</span>
+    </div>
+</div>
+"""
+
+
+def load_css():
+    st.markdown(_CSS_HTML, unsafe_allow_html=True)
 
 
 def load_particles():
-    # Optional particle background layer if particles.html exists
-    try:
-        with open("particles.html") as f:
-            st.markdown(f.read(), unsafe_allow_html=True)
-    except FileNotFoundError:
-        pass
+    if _PARTICLES_HTML:
+        st.markdown(_PARTICLES_HTML, unsafe_allow_html=True)
 
 
 load_css()
 load_particles()
 
 # ---- Global header ----
-st.markdown(
-    """
-    <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:0.8rem;">
-        <div class="main-title">
-            <span class="logo-dot"></span>
-            <span>NoVac — Air Quality Copilot</span>
-        </div>
-        <div class="nv-pill">
-            <span>🧠 Agentic AI</span>
-            <span>·</span>
-            <span>📊 Live AQI & Pollutants</span>
-            <span>·</span>
-            <span>📲 WhatsApp Alerts</span>
-        </div>
-    </div>
-    """,
-    unsafe_allow_html=True,
-)
+st.markdown(_HEADER_HTML, unsafe_allow_html=True)
 
 st.caption(
     "Switch between **Simple AQI Visualizer** and **Neon AI Copilot** — powered by OpenWeather, OpenAQ, Groq Llama 3 and WhatsApp Cloud API."
 )
 
+# -------------------------------------------------------
+# ASYNC HTTP HELPERS
+# -------------------------------------------------------
+async def _get_json(session, url, params=None):
+    async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+        return orjson.loads(await resp.read())
+
+
 # -------------------------------------------------------
 # AGENTIC AI (Groq)
 # -------------------------------------------------------
+AI_CACHE_TTL = 600  # seconds a finished insight is reused
+
+
+@st.cache_resource
+def get_groq_client():
+    """Build the Groq client (and its HTTP pool) once; None without an API key."""
+    from groq import Groq  # imported lazily: only the Copilot needs it
+
+    api_key = _init_env()[3] or st.secrets.get("groq_api_key", "")
+    return Groq(api_key=api_key) if api_key else None
+
+
+@st.cache_resource
+def _ai_cache():
+    """Finished insight texts shared across reruns: {key: (timestamp, text)}."""
+    return {}
+
+
+@st.cache_resource
+def _ai_cache_lock():
+    """Guards _ai_cache(); it is shared by every session's script thread."""
+    return threading.Lock()
+
+
+def _stream_ai(key, client):
+    """Yield the Groq completion for a bucketed copilot state as it arrives."""
+    cache, lock = _ai_cache(), _ai_cache_lock()
+    now = time.time()
+    with lock:
+        hit = cache.get(key)
+    if hit and now - hit[0] < AI_CACHE_TTL:
+        yield hit[1]
+        return
+
+    aqi, trend, spike, spike_change, forecast = key
+
+    prompt = f"""
+    You are NoVac AI — an environmental intelligence agent.
+    Analyze the following air quality data and give a smart, concise,
+    human-friendly explanation with actionable advice.
+
+    Current PM2.5: {aqi}
+    Trend direction: {trend}
+    Spike detected: {spike}
+    Spike jump: {spike_change}
+    Forecast (3 days): {list(forecast)}
+
+    Provide:
+    - A short summary in one sentence
+    - Health risk level
+    - Who should be most careful
+    - Whether people should stay indoors
+    - Any actionable recommendations
+    - Confidence level in your analysis
+    """
+
+    stream = client.chat.completions.create(
+        model="llama-3.1-8b-instant",
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+    )
+
+    parts = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        parts.append(delta)
+        yield delta
+
+    # Only complete responses are cached; drop expired entries on the way
+    with lock:
+        for k in [k for k, (ts, _) in cache.items() if now - ts >= AI_CACHE_TTL]:
+            del cache[k]
+        cache[key] = (time.time(), "".join(parts))
+
+
 def ai_agent_analysis(aqi, trend, spike, spike_change, forecast):
-    """Generate agent-style explanation using Groq free Llama 3."""
+    """Stream an agent-style explanation using Groq free Llama 3.
+
+    A failure, even one partway through the stream, sets
+    ``st.session_state.ai_failed`` so callers never keep a truncated text.
+    """
+    st.session_state.ai_failed = False
     try:
-        api_key = os.getenv("GROQ_API_KEY") or st.secrets.get("groq_api_key", "")
-        if not api_key:
-            return "AI Agent: GROQ_API_KEY not found in environment or secrets."
-        
-        client = Groq(api_key=api_key)
-
-        prompt = f"""
-        You are NoVac AI — an environmental intelligence agent.
-        Analyze the following air quality data and give a smart, concise,
-        human-friendly explanation with actionable advice.
-
-        Current PM2.5: {aqi}
-        Trend direction: {trend}
-        Spike detected: {spike}
-        Spike jump: {spike_change}
-        Forecast (3 days): {forecast}
-
-        Provide:
-        - A short summary in one sentence
-        - Health risk level
-        - Who should be most careful
-        - Whether people should stay indoors
-        - Any actionable recommendations
-        - Confidence level in your analysis
-        """
-
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[{"role": "user", "content": prompt}],
-        )
+        client = get_groq_client()
+        if client is None:
+            yield "AI Agent: GROQ_API_KEY not found in environment or secrets."
+            return
 
-        return response.choices[0].message.content
+        # Bucket the inputs so near-identical readings (e.g. autonomous ticks)
+        # reuse the same completion instead of paying for another LLM call
+        key = (
+            round(aqi / 5) * 5,
+            trend,
+            spike,
+            round(spike_change / 5) * 5,
+            tuple(round(f) for f in forecast),
+        )
+        yield from _stream_ai(key, client)
 
     except Exception as e:
-        return f"AI agent unavailable: {e}"
+        st.session_state.ai_failed = True
+        yield f"AI agent unavailable: {e}"
 
 
 # -------------------------------------------------------
 # WHATSAPP ALERTS
 # -------------------------------------------------------
-def send_whatsapp_alert(text: str):
-    """
-    Send a WhatsApp message using Cloud API.
-    Uses env vars: WHATSAPP_TOKEN, WHATSAPP_PHONE_ID, WHATSAPP_TO
-    """
-    token = os.getenv("WHATSAPP_TOKEN")
-    phone_id = os.getenv("WHATSAPP_PHONE_ID")
-    to = os.getenv("WHATSAPP_TO")
+@st.cache_resource
+def _background_loop():
+    """Event loop on a daemon thread, started once, for fire-and-forget sends."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="novac-whatsapp", daemon=True).start()
+    return loop
+
+
+async def _send_wa_async(client, creds, text):
+    token, phone_id, to = creds
 
     if not token or not phone_id or not to:
         return False, "Missing WHATSAPP_* env variables"
@@ -162,8 +256,8 @@ def send_whatsapp_alert(text: str):
     }
 
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=10)
-        data = resp.json()
+        resp = await client.post(url, json=payload, headers=headers)
+        data = orjson.loads(resp.content)
         if resp.status_code == 200 and "messages" in data:
             return True, "Sent"
         return False, f"API error: {data}"
@@ -171,50 +265,39 @@ def send_whatsapp_alert(text: str):
         return False, str(e)
 
 
-# -------------------------------------------------------
-# AQI FETCHER (OpenAQ for PM2.5) – used by Copilot
-# -------------------------------------------------------
-def fetch_current_aqi(city, mock=False):
-    if mock:
-        return random.randint(50, 250)
-
-    url = "https://api.openaq.org/v2/latest"
-
-    params = {
-        "limit": 100,
-        "page": 1,
-        "offset": 0,
-        "country": "IN",
-        "parameter": "pm25",
-        "location": city,  # Works when location matches station name
-    }
+async def _send_wa_batch(creds, texts):
+    async with httpx.AsyncClient(timeout=10) as client:
+        return await asyncio.gather(*(_send_wa_async(client, creds, t) for t in texts))
 
-    try:
-        r = requests.get(url, params=params, timeout=10)
-        data = r.json()
 
-        # Fallback: try as city field if no data
-        if len(data.get("results", [])) == 0:
-            params.pop("location", None)
-            params["city"] = city
-            r = requests.get(url, params=params, timeout=10)
-            data = r.json()
+def send_whatsapp_alert(*texts):
+    """
+    Send WhatsApp messages using Cloud API without blocking the rerun.
+    Uses env vars: WHATSAPP_TOKEN, WHATSAPP_PHONE_ID, WHATSAPP_TO
+    Returns a Future resolving to one (ok, msg) tuple per text.
+    """
+    token, phone_id, to, _ = _init_env()
+    return asyncio.run_coroutine_threadsafe(
+        _send_wa_batch((token, phone_id, to), texts), _background_loop()
+    )
 
-        if len(data.get("results", [])) == 0:
-            return None
 
-        # Read PM2.5 from either "measurements" or "parameters"
-        try:
-            return data["results"][0]["measurements"][0]["value"]
-        except Exception:
-            for p in data["results"][0].get("parameters", []):
-                if p.get("parameter") == "pm25":
-                    return p.get("lastValue")
+def render_whatsapp_status():
+    """Report the outcome of the last queued alert once it has finished."""
+    future = st.session_state.get("wa_status")
+    if future is None or not future.done():
+        return
+    st.session_state.wa_status = None
 
-        return None
+    statuses = future.result()
+    ok, msg = statuses[0]
+    if ok:
+        st.success("WhatsApp alert sent (summary).")
+    else:
+        st.warning(f"WhatsApp alert failed: {msg}")
 
-    except Exception:
-        return None
+    if len(statuses) > 1 and not statuses[1][0]:
+        st.warning(f"WhatsApp insight message failed: {statuses[1][1]}")
 
 
 # -------------------------------------------------------
@@ -231,27 +314,6 @@ from spike import (
 # -------------------------------------------------------
 # HELPERS FOR INDIAN AQI (CPCB)
 # -------------------------------------------------------
-def calc_aqi_subindex(C, breakpoints):
-    """
-    Generic linear interpolation for AQI sub-index.
-    C: concentration
-    breakpoints: list of dicts with C_low, C_high, I_low, I_high
-    """
-    if C is None:
-        return None
-    for bp in breakpoints:
-        if bp["C_low"] <= C <= bp["C_high"]:
-            return round(
-                ((bp["I_high"] - bp["I_low"]) / (bp["C_high"] - bp["C_low"]))
-                * (C - bp["C_low"]) + bp["I_low"]
-            )
-    # If above highest range, clamp to max index
-    last = breakpoints[-1]
-    if C > last["C_high"]:
-        return last["I_high"]
-    return None
-
-
 # CPCB Indian AQI breakpoints (24-hr) for PM2.5 and PM10
 PM25_BREAKPOINTS_IN = [
     {"C_low": 0.0, "C_high": 30.0, "I_low": 0, "I_high": 50},     # Good
@@ -272,43 +334,126 @@ PM10_BREAKPOINTS_IN = [
 ]
 
 
+
+def _breakpoint_arrays(breakpoints):
+    return tuple(
+        np.array([bp[k] for bp in breakpoints], dtype=float)
+        for k in ("C_low", "C_high", "I_low", "I_high")
+    )
+
+
+# Breakpoint columns as arrays (C_low, C_high, I_low, I_high), built once
+_BREAKPOINT_ARRAYS = {
+    "pm25": _breakpoint_arrays(PM25_BREAKPOINTS_IN),
+    "pm10": _breakpoint_arrays(PM10_BREAKPOINTS_IN),
+}
+
+
+def calc_aqi_subindex(C, key):
+    """
+    Piecewise-linear interpolation for AQI sub-index.
+    C: concentration (scalar or array)
+    key: "pm25" or "pm10"
+    """
+    if C is None:
+        return None
+    c_lo, c_hi, i_lo, i_hi = _BREAKPOINT_ARRAYS[key]
+
+    conc = np.asarray(C, dtype=float)
+    idx = np.minimum(np.searchsorted(c_hi, conc), len(c_hi) - 1)
+    # Values in the gaps between bands (e.g. 30.01) belong to the next band's
+    # floor; clamping keeps the sub-index from dipping as concentration rises
+    conc = np.maximum(conc, c_lo[idx])
+    sub = (i_hi[idx] - i_lo[idx]) / (c_hi[idx] - c_lo[idx]) * (conc - c_lo[idx]) + i_lo[idx]
+
+    # If above highest range, clamp to max index
+    sub = np.clip(np.rint(sub), i_lo[0], i_hi[-1]).astype(int)
+    return int(sub) if sub.ndim == 0 else sub
+
+# Upper bounds of each CPCB band (inclusive) and the matching labels
+_AQI_BOUNDS = np.array([50, 100, 200, 300, 400])
+
+_AQI_CATEGORIES = (
+    "Good 😊",
+    "Satisfactory 🙂",
+    "Moderate 😐",
+    "Poor 😷",
+    "Very Poor 🛑",
+    "Severe ☠️",
+)
+
+_AQI_SUGGESTIONS = (
+    "✅ Air quality is good. Great day to be outdoors!",
+    "🙂 Generally satisfactory. Sensitive individuals should monitor symptoms.",
+    "😐 May cause breathing discomfort to people with lung/heart disease, children, and older adults.",
+    "⚠️ Breathing discomfort likely on prolonged exposure. Consider reducing outdoor activities.",
+    "🚫 Very poor air. Avoid prolonged outdoor exposure, especially if you have respiratory or heart conditions.",
+    "☠️ Severe pollution. Stay indoors, use masks/air purifiers if possible, and avoid physical exertion.",
+)
+
+
+def _aqi_band(aqi):
+    return int(np.searchsorted(_AQI_BOUNDS, aqi, side="left"))
+
+
 def get_indian_aqi_category(aqi):
     if aqi is None:
         return "Unknown"
-    if aqi <= 50:
-        return "Good 😊"
-    elif aqi <= 100:
-        return "Satisfactory 🙂"
-    elif aqi <= 200:
-        return "Moderate 😐"
-    elif aqi <= 300:
-        return "Poor 😷"
-    elif aqi <= 400:
-        return "Very Poor 🛑"
-    else:
-        return "Severe ☠️"
+    return _AQI_CATEGORIES[_aqi_band(aqi)]
+
+
+def get_indian_aqi_category_vec(aqi_values):
+    """Category labels for an array of AQI values."""
+    return np.asarray(_AQI_CATEGORIES)[np.searchsorted(_AQI_BOUNDS, aqi_values, side="left")]
 
 
 def get_indian_aqi_suggestion(aqi):
     if aqi is None:
         return "AQI not available. Please try again."
-    if aqi <= 50:
-        return "✅ Air quality is good. Great day to be outdoors!"
-    elif aqi <= 100:
-        return "🙂 Generally satisfactory. Sensitive individuals should monitor symptoms."
-    elif aqi <= 200:
-        return "😐 May cause breathing discomfort to people with lung/heart disease, children, and older adults."
-    elif aqi <= 300:
-        return "⚠️ Breathing discomfort likely on prolonged exposure. Consider reducing outdoor activities."
-    elif aqi <= 400:
-        return "🚫 Very poor air. Avoid prolonged outdoor exposure, especially if you have respiratory or heart conditions."
-    else:
-        return "☠️ Severe pollution. Stay indoors, use masks/air purifiers if possible, and avoid physical exertion."
+    return _AQI_SUGGESTIONS[_aqi_band(aqi)]
 
 
 # -------------------------------------------------------
 # SIMPLE AQI VISUALIZER (OpenWeather → Indian AQI)
 # -------------------------------------------------------
+async def _fetch_geocode(city, api_key):
+    geocode_url = (
+        f"http://api.openweathermap.org/geo/1.0/direct?"
+        f"q={city}&limit=1&appid={api_key}"
+    )
+    async with aiohttp.ClientSession() as session:
+        return await _get_json(session, geocode_url)
+
+
+async def _fetch_air_pollution(lat, lon, api_key):
+    aqi_url = (
+        f"https://api.openweathermap.org/data/2.5/air_pollution?"
+        f"lat={lat}&lon={lon}&appid={api_key}"
+    )
+    async with aiohttp.ClientSession() as session:
+        return await _get_json(session, aqi_url)
+
+
+def geocode_city(city, api_key):
+    """Resolve a city to (lat, lon), or None when it cannot be resolved."""
+    try:
+        return _geocode_city_cached(city, api_key)
+    except LookupError:
+        return None
+
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def _geocode_city_cached(city, api_key):
+    # Coordinates are static, so a hit is cached for a day. Error bodies such
+    # as {"cod": 429, ...} raise instead, so they are never cached
+    geo_res = asyncio.run(_fetch_geocode(city, api_key))
+    if not isinstance(geo_res, list):
+        raise LookupError(f"geocoding failed for {city!r}: {geo_res!r}")
+    if geo_res:
+        return geo_res[0]["lat"], geo_res[0]["lon"]
+    return None
+
+
 def run_visualizer(city):
     st.markdown('<div class="nv-card">', unsafe_allow_html=True)
     st.markdown(
@@ -332,23 +477,14 @@ def run_visualizer(city):
             st.markdown("</div>", unsafe_allow_html=True)
             return
 
-        # Get coordinates
-        geocode_url = (
-            f"http://api.openweathermap.org/geo/1.0/direct?"
-            f"q={city}&limit=1&appid={api_key}"
-        )
-        geo_res = requests.get(geocode_url).json()
+        # Get coordinates (cached per city)
+        latlon = geocode_city(city, api_key)
 
-        if geo_res and isinstance(geo_res, list) and len(geo_res) > 0:
-            lat = geo_res[0]["lat"]
-            lon = geo_res[0]["lon"]
+        if latlon is not None:
+            lat, lon = latlon
 
             # Get AQI and components
-            aqi_url = (
-                f"https://api.openweathermap.org/data/2.5/air_pollution?"
-                f"lat={lat}&lon={lon}&appid={api_key}"
-            )
-            aqi_res = requests.get(aqi_url).json()
+            aqi_res = asyncio.run(_fetch_air_pollution(lat, lon, api_key))
 
             if "list" in aqi_res and len(aqi_res["list"]) > 0:
                 components = aqi_res["list"][0]["components"]
@@ -359,8 +495,8 @@ def run_visualizer(city):
                 # Compute Indian AQI sub-indices
                 aqi_values = []
 
-                aqi_pm25 = calc_aqi_subindex(pm2_5, PM25_BREAKPOINTS_IN) if pm2_5 is not None else None
-                aqi_pm10 = calc_aqi_subindex(pm10, PM10_BREAKPOINTS_IN) if pm10 is not None else None
+                aqi_pm25 = calc_aqi_subindex(pm2_5, "pm25") if pm2_5 is not None else None
+                aqi_pm10 = calc_aqi_subindex(pm10, "pm10") if pm10 is not None else None
 
                 if aqi_pm25 is not None:
                     aqi_values.append(aqi_pm25)
@@ -393,15 +529,12 @@ def run_visualizer(city):
 
                 # Show pollutant values in chart
                 st.subheader("📊 Pollutant Concentrations (μg/m³)")
-                df = pd.DataFrame(components.items(), columns=["Pollutant", "Value"])
-                df = df.sort_values(by="Value", ascending=False)
+                items = sorted(components.items(), key=lambda kv: -kv[1])
+                df = pd.DataFrame(items, columns=["Pollutant", "Value"])
                 st.bar_chart(df.set_index("Pollutant"))
 
-                # Downloadable CSV
-                csv_data = pd.DataFrame(
-                    components.items(), columns=["Pollutant", "Value"]
-                )
-                csv = csv_data.to_csv(index=False).encode("utf-8")
+                # Downloadable CSV (same frame as the chart)
+                csv = df.to_csv(index=False).encode("utf-8")
 
                 st.download_button(
                     label="📥 Download Pollutant Data as CSV",
@@ -421,16 +554,81 @@ def run_visualizer(city):
 # -------------------------------------------------------
 # AI COPILOT UI (from novac_copilot.py, adapted)
 # -------------------------------------------------------
+AUTO_INTERVAL_S = 30  # autonomous re-analysis cadence
+
+_COUNTDOWN_HTML = f"""
+<div id="cd" style="font-family:sans-serif; font-size:0.85rem; color:#a5b4fc;"></div>
+<script>
+    let left = {AUTO_INTERVAL_S};
+    const el = document.getElementById("cd");
+    const tick = () => {{
+        el.textContent = "🔄 Next auto-analysis in " + left + " seconds...";
+        left = left > 1 ? left - 1 : {AUTO_INTERVAL_S};
+    }};
+    tick();
+    setInterval(tick, 1000);
+</script>
+"""
+
+
+# Fresh runs draw a new random forecast, so hits come from redraws of the last
+# result; bounded so autonomous ticks never grow the cache without limit
+@st.cache_data(ttl=600, max_entries=32, show_spinner=False)
+def _build_neon_chart(forecast):
+    """Vega-Lite spec for the 3-day forecast card, keyed on the forecast tuple."""
+    days = ("Day 1", "Day 2", "Day 3")
+    records = [{"Day": d, "PM2.5": v} for d, v in zip(days, forecast)]
+    ymin = min(forecast) - 20
+    ymax = max(forecast) + 20
+
+    return {
+        "width": "container",
+        "height": 260,
+        "background": None,
+        "data": {
+            "values": records,
+        },
+        "mark": {
+            "type": "line",
+            "point": {"filled": True, "size": 80, "color": "#3bffb3"},
+            "strokeWidth": 4,
+            "color": "#ff4dd8",
+        },
+        "encoding": {
+            "x": {
+                "field": "Day",
+                "type": "nominal",
+                "axis": {"labelColor": "#ccc", "labelAngle": 0},
+            },
+            "y": {
+                "field": "PM2.5",
+                "type": "quantitative",
+                "scale": {"domain": [float(ymin), float(ymax)]},
+                "axis": {
+                    "title": "PM2.5 Forecast",
+                    "labelColor": "#ccc",
+                    "gridColor": "rgba(255,255,255,0.12)",
+                },
+            },
+        },
+        "config": {
+            "view": {"stroke": "transparent"},
+            "axis": {
+                "domainColor": "#666",
+                "tickColor": "#777",
+            },
+        },
+    }
+
+
 def run_copilot_ui(city, mock_mode, auto_mode, whatsapp_enabled):
     # Initialize session state
     if "last_aqi" not in st.session_state:
         st.session_state.last_aqi = None
     if "history" not in st.session_state:
-        st.session_state.history = []
-    if "last_run_time" not in st.session_state:
-        st.session_state.last_run_time = 0
-    if "run_count" not in st.session_state:
-        st.session_state.run_count = 0
+        st.session_state.history = np.empty(0, dtype=np.float32)
+
+    render_whatsapp_status()
 
     # Dashboard header / run button
     top_bar = st.container()
@@ -453,18 +651,21 @@ def run_copilot_ui(city, mock_mode, auto_mode, whatsapp_enabled):
                 )
 
     # Determine if we should run analysis
-    should_run = False
-    
+    new_tick = False
     if auto_mode:
-        # Auto mode: run every 30 seconds or on first load
-        current_time = time.time()
-        if current_time - st.session_state.last_run_time > 30 or st.session_state.run_count == 0:
-            should_run = True
-            st.session_state.last_run_time = current_time
-            st.session_state.run_count += 1
+        # Auto mode: the browser schedules exactly one rerun every 30 seconds
+        tick = st_autorefresh(interval=AUTO_INTERVAL_S * 1000, key="novac_copilot_tick")
+        # Countdown ticks client-side, so it costs no server reruns
+        components.html(_COUNTDOWN_HTML, height=34)
+        # Other reruns (widget changes) leave the counter alone and skip the pipeline
+        new_tick = tick != st.session_state.get("copilot_last_tick")
+        st.session_state.copilot_last_tick = tick
     else:
-        # Manual mode: run only when button is clicked
-        should_run = run_clicked
+        # Re-enabling auto mode restarts the counter, so forget the old tick
+        st.session_state.pop("copilot_last_tick", None)
+
+    # Manual mode: run only when button is clicked
+    should_run = new_tick or run_clicked
 
     if should_run:
         with st.empty():
@@ -475,205 +676,173 @@ def run_copilot_ui(city, mock_mode, auto_mode, whatsapp_enabled):
                 mock=mock_mode,
             )
 
-        if result:
-            st.session_state.last_aqi = new_last
-            st.session_state.history = new_history
+        if not result:
+            st.error("API Error! Try enabling Mock Mode.")
+            return
 
-            dec = result["decision"]
+        st.session_state.last_aqi = new_last
+        st.session_state.history = new_history
+        st.session_state.copilot_last_result = {"result": result, "ai_text": None}
 
-            # ==== Top dashboard row: METRIC / ALERTS / FORECAST ====
-            col_a, col_b, col_c = st.columns([1.2, 1.1, 1.2])
+    # Reruns in between (e.g. Apply while autonomous) redraw the last result
+    elif "copilot_last_result" not in st.session_state:
+        st.info(
+            "Click **Run Analysis Now** or enable **Autonomous Mode** in the sidebar to wake the Copilot."
+        )
+        return
 
-            with col_a:
-                st.markdown('<div class="nv-card">', unsafe_allow_html=True)
-                st.markdown(
-                    '<div class="nv-card-header">Current Load</div>',
-                    unsafe_allow_html=True,
-                )
-                st.metric("PM2.5 (µg/m³)", result["current"])
-                trend_label = {
-                    "up": "📈 Rising",
-                    "down": "📉 Dropping",
-                    "stable": "➖ Stable",
-                }[result["trend"]]
-                st.markdown(f"**Trend:** {trend_label}")
-                st.markdown("</div>", unsafe_allow_html=True)
-
-            with col_b:
-                st.markdown('<div class="nv-card">', unsafe_allow_html=True)
-                st.markdown(
-                    '<div class="nv-card-header">System Alerts</div>',
-                    unsafe_allow_html=True,
-                )
-                if result["spike"]:
-                    st.error(f"⚠️ Spike Detected (+{result['spike_change']})")
-                else:
-                    st.info("No sudden spike detected in latest reading.")
-                if dec["severity"] == "High":
-                    st.error(f"{dec['status']} — {dec['details']}")
-                elif dec["severity"] == "Medium":
-                    st.warning(f"{dec['status']} — {dec['details']}")
-                else:
-                    st.success(f"{dec['status']} — {dec['details']}")
-                st.markdown("</div>", unsafe_allow_html=True)
-
-            with col_c:
-                st.markdown('<div class="nv-card">', unsafe_allow_html=True)
-                st.markdown(
-                    '<div class="nv-card-header">3-Day Forecast</div>',
-                    unsafe_allow_html=True,
-                )
+    last = st.session_state.copilot_last_result
+    result = last["result"]
 
-                forecast_df = pd.DataFrame(
-                    {
-                        "Day": ["Day 1", "Day 2", "Day 3"],
-                        "PM2.5": result["forecast"],
-                    }
-                )
+    dec = result["decision"]
 
-                neon_chart = {
-                    "width": "container",
-                    "height": 260,
-                    "background": None,
-                    "data": {
-                        "values": forecast_df.to_dict(orient="records"),
-                    },
-                    "mark": {
-                        "type": "line",
-                        "point": {"filled": True, "size": 80, "color": "#3bffb3"},
-                        "strokeWidth": 4,
-                        "color": "#ff4dd8",
-                    },
-                    "encoding": {
-                        "x": {
-                            "field": "Day",
-                            "type": "nominal",
-                            "axis": {"labelColor": "#ccc", "labelAngle": 0},
-                        },
-                        "y": {
-                            "field": "PM2.5",
-                            "type": "quantitative",
-                            "scale": {
-                                "domain": [
-                                    float(forecast_df["PM2.5"].min()) - 20,
-                                    float(forecast_df["PM2.5"].max()) + 20,
-                                ]
-                            },
-                            "axis": {
-                                "title": "PM2.5 Forecast",
-                                "labelColor": "#ccc",
-                                "gridColor": "rgba(255,255,255,0.12)",
-                            },
-                        },
-                    },
-                    "config": {
-                        "view": {"stroke": "transparent"},
-                        "axis": {
-                            "domainColor": "#666",
-                            "tickColor": "#777",
-                        },
-                    },
-                }
-
-                st.vega_lite_chart(neon_chart, use_container_width=True)
-                st.table(forecast_df[["Day", "PM2.5"]])
-
-                st.markdown("</div>", unsafe_allow_html=True)
-            
-            # ==== AI Insight + Trend (2nd row) ====
-            col_ai, col_trend = st.columns([1.35, 1])
-
-            with col_ai:
-                st.markdown('<div class="nv-card">', unsafe_allow_html=True)
-                st.markdown(
-                    '<div class="nv-card-header">NoVac AI Copilot Insight</div>',
-                    unsafe_allow_html=True,
-                )
-                st.markdown(
-                    '<div class="ai-thinking"><div class="ai-dot"></div>'
-                    '<span>Copilot is analyzing live data...</span></div><br><br>',
-                    unsafe_allow_html=True,
-                )
-                with st.spinner("🧠 Thinking like an environmental expert..."):
-                    ai_text = ai_agent_analysis(
-                        result["current"],
-                        result["trend"],
-                        result["spike"],
-                        result["spike_change"],
-                        result["forecast"],
-                    )
-                st.write(ai_text)
-                st.markdown("</div>", unsafe_allow_html=True)
-
-            with col_trend:
-                st.markdown('<div class="nv-card">', unsafe_allow_html=True)
-                st.markdown(
-                    '<div class="nv-card-header">Recent PM2.5 Trajectory</div>',
-                    unsafe_allow_html=True,
-                )
-                st.line_chart(result["history"])
-                st.markdown("</div>", unsafe_allow_html=True)
-
-            # ===========================
-            # WHATSAPP SMART ALERT LOGIC
-            # ===========================
-            # Only send alerts on manual runs (not in auto_mode) to avoid spam
-            if whatsapp_enabled and not auto_mode:
-                aqi_val = float(result["current"])
-                reasons = []
-
-                if result["spike"]:
-                    reasons.append("Spike detected")
-                if aqi_val >= 200:
-                    reasons.append("Very unhealthy AQI")
-                elif aqi_val >= 150:
-                    reasons.append("Unhealthy AQI")
-
-                should_alert = len(reasons) > 0
-
-                if should_alert:
-                    reasons_str = ", ".join(reasons)
-                    short_alert = (
-                        f"🩷 NoVac AQI Alert for {city}:\n"
-                        f"PM2.5: {aqi_val:.1f}\n"
-                        f"Status: {dec['status']}\n"
-                        f"Trend: {result['trend']}\n"
-                        f"Reason: {reasons_str}"
-                    )
-
-                    ok, msg = send_whatsapp_alert(short_alert)
-                    if ok:
-                        st.success("WhatsApp alert sent (summary).")
-                    else:
-                        st.warning(f"WhatsApp alert failed: {msg}")
-
-                    # Second message: LLM explanation
-                    if ai_text and not ai_text.startswith("AI agent unavailable"):
-                        long_msg = f"🧠 NoVac Copilot insight for {city}:\n{ai_text}"
-                        if len(long_msg) > 3900:
-                            long_msg = long_msg[:3900] + "..."
-                        send_whatsapp_alert(long_msg)
+    # Signature of the reading: when it matches the previous run, the
+    # LLM insight and WhatsApp alerts would only repeat themselves
+    sig = hash((
+        round(result["current"]),
+        result["trend"],
+        result["spike"],
+        tuple(round(x) for x in result["forecast"]),
+    ))
+    unchanged = st.session_state.get("last_sig") == sig
 
+    # ==== Top dashboard row: METRIC / ALERTS / FORECAST ====
+    col_a, col_b, col_c = st.columns([1.2, 1.1, 1.2])
+
+    with col_a:
+        st.markdown('<div class="nv-card">', unsafe_allow_html=True)
+        st.markdown(
+            '<div class="nv-card-header">Current Load</div>',
+            unsafe_allow_html=True,
+        )
+        st.metric("PM2.5 (µg/m³)", result["current"])
+        trend_label = {
+            "up": "📈 Rising",
+            "down": "📉 Dropping",
+            "stable": "➖ Stable",
+        }[result["trend"]]
+        st.markdown(f"**Trend:** {trend_label}")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    with col_b:
+        st.markdown('<div class="nv-card">', unsafe_allow_html=True)
+        st.markdown(
+            '<div class="nv-card-header">System Alerts</div>',
+            unsafe_allow_html=True,
+        )
+        if result["spike"]:
+            st.error(f"⚠️ Spike Detected (+{result['spike_change']})")
         else:
-            st.error("API Error! Try enabling Mock Mode.")
-    else:
-        if auto_mode:
-            # Show countdown for next auto-run
-            if st.session_state.last_run_time > 0:
-                next_run = int(30 - (time.time() - st.session_state.last_run_time))
-                if next_run > 0:
-                    st.info(f"🔄 Next auto-analysis in {next_run} seconds...")
-                else:
-                    st.info("🔄 Running analysis now...")
-            else:
-                st.info("🔄 Initializing autonomous monitoring...")
-            
-            # Auto-refresh the page to trigger next run
-            st.rerun()
+            st.info("No sudden spike detected in latest reading.")
+        if dec["severity"] == "High":
+            st.error(f"{dec['status']} — {dec['details']}")
+        elif dec["severity"] == "Medium":
+            st.warning(f"{dec['status']} — {dec['details']}")
         else:
-            st.info(
-                "Click **Run Analysis Now** or enable **Autonomous Mode** in the sidebar to wake the Copilot."
+            st.success(f"{dec['status']} — {dec['details']}")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    with col_c:
+        st.markdown('<div class="nv-card">', unsafe_allow_html=True)
+        st.markdown(
+            '<div class="nv-card-header">3-Day Forecast</div>',
+            unsafe_allow_html=True,
+        )
+
+        neon_chart = _build_neon_chart(tuple(result["forecast"]))
+        st.vega_lite_chart(neon_chart, use_container_width=True)
+        st.table(pd.DataFrame(neon_chart["data"]["values"]))
+
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    # ==== AI Insight + Trend (2nd row) ====
+    col_ai, col_trend = st.columns([1.35, 1])
+
+    with col_ai:
+        st.markdown('<div class="nv-card">', unsafe_allow_html=True)
+        st.markdown(
+            '<div class="nv-card-header">NoVac AI Copilot Insight</div>',
+            unsafe_allow_html=True,
+        )
+        st.markdown(
+            '<div class="ai-thinking"><div class="ai-dot"></div>'
+            '<span>Copilot is analyzing live data...</span></div><br><br>',
+            unsafe_allow_html=True,
+        )
+        if last["ai_text"] is not None:
+            # Redraw: show the insight this result was displayed with
+            ai_text = last["ai_text"]
+            st.write(ai_text)
+        elif unchanged:
+            ai_text = st.session_state.last_ai_text
+            st.write(ai_text)
+        else:
+            ai_text = st.write_stream(
+                ai_agent_analysis(
+                    result["current"],
+                    result["trend"],
+                    result["spike"],
+                    result["spike_change"],
+                    result["forecast"],
+                )
             )
+            if not st.session_state.ai_failed:
+                st.session_state.last_sig = sig
+                st.session_state.last_ai_text = ai_text
+        last["ai_text"] = ai_text
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    with col_trend:
+        st.markdown('<div class="nv-card">', unsafe_allow_html=True)
+        st.markdown(
+            '<div class="nv-card-header">Recent PM2.5 Trajectory</div>',
+            unsafe_allow_html=True,
+        )
+        st.line_chart(result["history"])
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    # ===========================
+    # WHATSAPP SMART ALERT LOGIC
+    # ===========================
+    # Only send alerts on fresh manual runs (not in auto_mode, not on redraws)
+    # to avoid spam, and never twice for the same reading
+    if should_run and whatsapp_enabled and not auto_mode and not unchanged:
+        aqi_val = float(result["current"])
+        reasons = []
+
+        if result["spike"]:
+            reasons.append("Spike detected")
+        if aqi_val >= 200:
+            reasons.append("Very unhealthy AQI")
+        elif aqi_val >= 150:
+            reasons.append("Unhealthy AQI")
+
+        should_alert = len(reasons) > 0
+
+        if should_alert:
+            reasons_str = ", ".join(reasons)
+            short_alert = (
+                f"🩷 NoVac AQI Alert for {city}:\n"
+                f"PM2.5: {aqi_val:.1f}\n"
+                f"Status: {dec['status']}\n"
+                f"Trend: {result['trend']}\n"
+                f"Reason: {reasons_str}"
+            )
+
+            messages = [short_alert]
+
+            # Second message: LLM explanation
+            if ai_text and not st.session_state.get("ai_failed"):
+                long_msg = f"🧠 NoVac Copilot insight for {city}:\n{ai_text}"
+                if len(long_msg) > 3900:
+                    long_msg = long_msg[:3900] + "..."
+                messages.append(long_msg)
+
+            # Both messages go out concurrently in the background;
+            # the outcome is reported on the next rerun
+            st.session_state.wa_status = send_whatsapp_alert(*messages)
+            st.info("WhatsApp alert queued.")
+
 
 
 # -------------------------------------------------------
@@ -682,23 +851,28 @@ def run_copilot_ui(city, mock_mode, auto_mode, whatsapp_enabled):
 def main():
     st.sidebar.header("⚙️ NoVac Control Center")
 
-    mode = st.sidebar.radio(
-        "Choose Mode",
-        ["AQI Visualizer", "AI Copilot", "VAYU Gpt", "AQI Heatmap"],
-        index=0,
-    )
+    # Controls live in a form so typing a city or flipping a toggle only
+    # reruns the app on "Apply"; until then the last applied values are used
+    with st.sidebar.form("novac_controls"):
+        mode = st.radio(
+            "Choose Mode",
+            ["AQI Visualizer", "AI Copilot", "VAYU Gpt", "AQI Heatmap"],
+            index=0,
+        )
+
+        city = st.text_input("City:", value="Mumbai")
 
-    city = st.sidebar.text_input("City:", value="Mumbai")
+        mock_mode = False
+        auto_mode = False
+        whatsapp_enabled = False
 
-    mock_mode = False
-    auto_mode = False
-    whatsapp_enabled = False
+        if mode == "AI Copilot":
+            mock_mode = st.toggle("Use Mock AQI Data", value=True)
+            auto_mode = st.toggle("Autonomous Mode", value=False)
+            whatsapp_enabled = st.toggle("Enable WhatsApp Alerts", value=False)
+            st.write("Mock Mode is recommended for testing & demos.")
 
-    if mode == "AI Copilot":
-        mock_mode = st.sidebar.toggle("Use Mock AQI Data", value=True)
-        auto_mode = st.sidebar.toggle("Autonomous Mode", value=False)
-        whatsapp_enabled = st.sidebar.toggle("Enable WhatsApp Alerts", value=False)
-        st.sidebar.write("Mock Mode is recommended for testing & demos.")
+        st.form_submit_button("Apply")
 
     st.sidebar.markdown("---")
     st.sidebar.caption("NoVac · Pollution Intelligence Copilot")
@@ -708,8 +882,13 @@ def main():
     elif mode == "AI Copilot":
         run_copilot_ui(city, mock_mode, auto_mode, whatsapp_enabled)
     elif mode == "AQI Heatmap":
+        # Heavy modules are imported only for the mode that needs them
+        from heatmap_openweather import heatmap_ui_openweather
+
         heatmap_ui_openweather(city)
     else:
+        from chatbot import vayu_chatbot_ui
+
         vayu_chatbot_ui()
 
 
@@ -1,22 +1,55 @@
 import random
+import asyncio
+import aiohttp
+import heapq
+import orjson
 import requests
-
-
-# ---------------------------------------------
-# Extract PM2.5 from OpenAQ result safely
-# ---------------------------------------------
-def extract_pm25_from_station(station):
-    """Return PM2.5 for a single station row."""
-    try:
-        if "measurements" in station:
-            return station["measurements"][0].get("value")
-
-        for p in station.get("parameters", []):
-            if p.get("parameter") == "pm25":
-                return p.get("lastValue")
-        return None
-    except:
-        return None
+from operator import itemgetter
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+import streamlit as st
+
+OPENAQ_URL = "https://api.openaq.org/v2/latest"
+
+# One HTTP policy for every outbound call, requests and aiohttp alike:
+# transient 429/5xx are retried with exponential backoff (honouring
+# Retry-After), and (connect, read) limits make dead endpoints fail fast
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_RETRIES = 3
+_BACKOFF = 0.5
+HTTP_TIMEOUT = (3, 7)
+_CLIENT_TIMEOUT = aiohttp.ClientTimeout(sock_connect=HTTP_TIMEOUT[0], sock_read=HTTP_TIMEOUT[1])
+
+
+def make_http_session():
+    """Pooled keep-alive requests session carrying the shared retry policy.
+
+    Only GETs are retried, so a POST such as a WhatsApp alert is never sent twice.
+    """
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=_RETRIES,
+            backoff_factor=_BACKOFF,
+            status_forcelist=_RETRY_STATUSES,
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+        ),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _normalize_city(city):
+    """Cache key for a city: trimmed and single-spaced, case left intact.
+
+    The key doubles as the query value, and OpenAQ location names such as
+    "IGI Airport" or "RK Puram" are case-sensitive.
+    """
+    return " ".join(city.split())
 
 
 # ---------------------------------------------
@@ -26,59 +59,26 @@ def fetch_current_aqi(city, mock=False):
     """Fetch a single PM2.5 value for the city."""
     if mock:
         return random.randint(60, 180)
-
-    url = "https://api.openaq.org/v2/latest"
-
-    # 1) Direct city match
-    params_city = {
-        "country": "IN",
-        "parameter": "pm25",
-        "city": city,
-        "limit": 50
-    }
-
     try:
-        r = requests.get(url, params=params_city, timeout=10)
-        data = r.json()
-        if data.get("results"):
-            return extract_pm25_from_station(data["results"][0])
-    except:
-        pass
-
-    # 2) Fuzzy "search" mode
-    params_search = {
-        "country": "IN",
-        "parameter": "pm25",
-        "search": city,
-        "limit": 50
-    }
-
-    try:
-        r = requests.get(url, params=params_search, timeout=10)
-        data = r.json()
-        if data.get("results"):
-            return extract_pm25_from_station(data["results"][0])
-    except:
-        pass
-
-    # 3) Station name match
-    params_loc = {
-        "country": "IN",
-        "parameter": "pm25",
-        "location": city,
-        "limit": 50
-    }
-
-    try:
-        r = requests.get(url, params=params_loc, timeout=10)
-        data = r.json()
-        if data.get("results"):
-            return extract_pm25_from_station(data["results"][0])
-    except:
-        pass
-
-    # 4) Fallback values (avoid None)
-    return random.randint(60, 140)
+        return _fetch_current_aqi_live(_normalize_city(city))
+    except LookupError:
+        # 4) Fallback values (avoid None); never cached, so the next call retries
+        return random.randint(60, 140)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_current_aqi_live(city):
+    # Reused for a minute per city (OpenAQ updates slower), so autonomous
+    # Copilot ticks share one lookup; raising on a miss keeps failures out
+    # 1) Direct city match  2) Fuzzy "search" mode  3) Station name match
+    pm25 = asyncio.run(_query_openaq([
+        {"country": "IN", "parameter": "pm25", "city": city, "limit": 50},
+        {"country": "IN", "parameter": "pm25", "search": city, "limit": 50},
+        {"country": "IN", "parameter": "pm25", "location": city, "limit": 50},
+    ], _first_pm25))
+    if pm25 is None:
+        raise LookupError(f"no PM2.5 reading for {city!r}")
+    return pm25
 
 
 # ---------------------------------------------
@@ -88,106 +88,130 @@ def fetch_current_aqi(city, mock=False):
 
 # Extract PM2.5 from station object
 def extract_pm25_from_station(st):
-    try:
-        # new OpenAQ format
-        if "measurements" in st:
-            for m in st["measurements"]:
-                if m["parameter"] == "pm25":
-                    return m["value"]
-        # fallback format
-        for p in st.get("parameters", []):
-            if p.get("parameter") == "pm25":
-                return p.get("lastValue")
-    except:
-        return None
+    """Return PM2.5 for a single station row (measurements or parameters shape)."""
+    # new OpenAQ format
+    for m in st.get("measurements") or []:
+        if m.get("parameter") == "pm25":
+            return m.get("value")
+    # fallback format
+    for p in st.get("parameters") or []:
+        if p.get("parameter") == "pm25":
+            return p.get("lastValue")
     return None
 
 
-def fetch_city_stations(city):
-    """Return station-level PM2.5 readings WITH coordinates (required for heatmap)."""
+def _first_pm25(results):
+    """First PM2.5 value among the rows, or None when none carries one."""
+    return next((pm for pm in map(extract_pm25_from_station, results) if pm is not None), None)
 
-    url = "https://api.openaq.org/v2/latest"
-    stations = []
 
-    # ---------- TRY EXACT CITY ----------
-    params_city = {
-        "country": "IN",
-        "parameter": "pm25",
-        "city": city.capitalize(),
-        "limit": 200
-    }
+async def fetch_json(session, url, params=None):
+    """GET ``url`` as JSON, retrying transient 429/5xx and timeouts with backoff.
 
-    try:
-        r = requests.get(url, params=params_city, timeout=10)
-        data = r.json()
-
-        for st in data.get("results", []):
-            pm = extract_pm25_from_station(st)
-            if pm is not None:
-                stations.append({
-                    "station": st.get("location"),
-                    "value": pm,
-                    "lat": st.get("coordinates", {}).get("latitude"),
-                    "lon": st.get("coordinates", {}).get("longitude")
-                })
-    except:
-        pass
-
-    # ---------- TRY SEARCH MODE ----------
-    if not stations:
-        params_search = {
-            "country": "IN",
-            "parameter": "pm25",
-            "search": city,
-            "limit": 200
+    Waits 0.5, 1, 2 s between attempts (or the server's Retry-After); the
+    last failure propagates to the caller.
+    """
+    for attempt in range(_RETRIES + 1):
+        last = attempt == _RETRIES
+        try:
+            async with session.get(url, params=params, timeout=_CLIENT_TIMEOUT) as resp:
+                if last or resp.status not in _RETRY_STATUSES:
+                    return orjson.loads(await resp.read())
+                retry_after = resp.headers.get("Retry-After", "")
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if last:
+                raise
+            retry_after = ""
+        delay = _BACKOFF * 2 ** attempt
+        if retry_after.isdigit():
+            delay = min(int(retry_after), 10)
+        await asyncio.sleep(delay)
+
+
+def _iter_stations(results):
+    # Rows without a PM2.5 value or coordinates are skipped, never built
+    for st in results:
+        pm = extract_pm25_from_station(st)
+        if pm is None:
+            continue
+        coords = st.get("coordinates") or {}
+        lat, lon = coords.get("latitude"), coords.get("longitude")
+        if lat is None or lon is None:
+            continue
+        yield {
+            "station": st.get("location"),
+            "value": pm,
+            "lat": lat,
+            "lon": lon
         }
 
+
+async def _query_openaq(param_sets, parse):
+    """Fire all query variants at once but honour their priority order.
+
+    ``parse`` turns a ``results`` list into the caller's value (None when it
+    holds nothing usable); the first variant in list order that parses wins,
+    so a fuzzy match never beats an exact one just by answering sooner.
+    """
+    async with aiohttp.ClientSession() as session:
+        tasks = [asyncio.ensure_future(fetch_json(session, OPENAQ_URL, p)) for p in param_sets]
         try:
-            r = requests.get(url, params=params_search, timeout=10)
-            data = r.json()
-
-            for st in data.get("results", []):
-                pm = extract_pm25_from_station(st)
-                if pm is not None:
-                    stations.append({
-                        "station": st.get("location"),
-                        "value": pm,
-                        "lat": st.get("coordinates", {}).get("latitude"),
-                        "lon": st.get("coordinates", {}).get("longitude")
-                    })
-        except:
-            pass
-
-    # ---------- OPTIONAL: LOCATION fallback ----------
+            for task in tasks:
+                try:
+                    data = await task
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                    continue
+                value = parse(data.get("results") or [])
+                if value is not None:
+                    return value
+        finally:
+            # Lower-priority variants are cancelled once a winner is found
+            for t in tasks:
+                t.cancel()
+    return None
+
+
+def _rank_stations(results, top_n=None):
+    """Stations sorted by PM2.5 descending, or None when there are none."""
+    stations = _iter_stations(results)
+    # A top-N caller only keeps a small heap; the full list is never built
+    if top_n is not None:
+        return heapq.nlargest(top_n, stations, key=itemgetter("value")) or None
+    return sorted(stations, key=itemgetter("value"), reverse=True) or None
+
+
+async def _fetch_city_stations_async(city, top_n=None):
+    # Exact city, search mode and location fallback, all in flight at once
+    stations = await _query_openaq([
+        {"country": "IN", "parameter": "pm25", "city": city.capitalize(), "limit": 200},
+        {"country": "IN", "parameter": "pm25", "search": city, "limit": 200},
+        {"country": "IN", "parameter": "pm25", "location": city, "limit": 200},
+    ], lambda results: _rank_stations(results, top_n))
+    return stations or []
+
+
+def fetch_city_stations(city, top_n=None):
+    """Return station-level PM2.5 readings WITH coordinates (required for heatmap).
+
+    ``top_n`` limits the result to the N highest readings; None keeps them all.
+    """
+    try:
+        return _fetch_city_stations_cached(_normalize_city(city), top_n)
+    except LookupError:
+        # Never cached, so a brief OpenAQ outage clears on the next call
+        return []
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_city_stations_cached(city, top_n=None):
+    stations = asyncio.run(_fetch_city_stations_async(city, top_n))
     if not stations:
-        params_location = {
-            "country": "IN",
-            "parameter": "pm25",
-            "location": city,
-            "limit": 200
-        }
+        raise LookupError(f"no PM2.5 stations for {city!r}")
+    return stations
 
-        try:
-            r = requests.get(url, params=params_location, timeout=10)
-            data = r.json()
-
-            for st in data.get("results", []):
-                pm = extract_pm25_from_station(st)
-                if pm is not None:
-                    stations.append({
-                        "station": st.get("location"),
-                        "value": pm,
-                        "lat": st.get("coordinates", {}).get("latitude"),
-                        "lon": st.get("coordinates", {}).get("longitude")
-                    })
-        except:
-            pass
-
-    # Clean invalid entries
-    stations = [
-        s for s in stations
-        if s["lat"] is not None and s["lon"] is not None
-    ]
-
-    # Sort by PM2.5 descending
-    return sorted(stations, key=lambda x: x["value"], reverse=True)
+
+def fetch_city_bundle(city, top_n=None):
+    """One station fetch serving both the headline PM2.5 and the station list."""
+    stations = fetch_city_stations(city, top_n=top_n)
+    top_pm25 = stations[0]["value"] if stations else None
+    return top_pm25, stations
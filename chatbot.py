@@ -5,8 +5,10 @@
 import streamlit as st
 from groq import Groq
 import os
+import re
+from functools import lru_cache
 from spike import run_copilot
-from aqi import fetch_current_aqi, fetch_city_stations
+from aqi import fetch_city_bundle
 
 
 # -------------------------------------------------------
@@ -32,13 +34,19 @@ Abilities:
 # -------------------------------------------------------
 # LLM RESPONSE
 # -------------------------------------------------------
+VAYU_MODEL = "llama-3.1-8b-instant"
+
+
+# One client (and one httpx connection pool) for every chatbot turn
+@lru_cache(maxsize=1)
+def _groq_client():
+    return Groq(api_key=os.getenv("GROQ_API_KEY") or st.secrets["groq_api_key"])
+
+
 def vayu_llm(messages):
     try:
-        api_key = os.getenv("GROQ_API_KEY") or st.secrets["groq_api_key"]
-        client = Groq(api_key=api_key)
-
-        resp = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
+        resp = _groq_client().chat.completions.create(
+            model=VAYU_MODEL,
             messages=messages,
         )
         return resp.choices[0].message.content
@@ -50,10 +58,12 @@ def vayu_llm(messages):
 # -------------------------------------------------------
 # CITY DETECTOR
 # -------------------------------------------------------
+_CITY_RE = re.compile(r"[A-Za-z]{3,}")
+
+
 def extract_city(text):
-    words = text.lower().replace(",", " ").split()
-    possible = [w.capitalize() for w in words if w.isalpha() and len(w) >= 3]
-    return possible[-1] if possible else None
+    matches = _CITY_RE.findall(text)
+    return matches[-1].capitalize() if matches else None
 
 
 # -------------------------------------------------------
@@ -107,11 +117,32 @@ def format_decision_engine(dec):
 
 
 # -------------------------------------------------------
-# CHATBOT UI
+# CHAT STATE
 # -------------------------------------------------------
-def vayu_chatbot_ui():
-    # Inject CSS styles
-    st.markdown("""
+# Messages sent to Groq besides the system prompt; older ones are trimmed
+VAYU_MAX_MESSAGES = 20
+
+
+def _init_chat_state():
+    if "vayu_history" not in st.session_state:
+        st.session_state.vayu_history = []
+    if "vayu_messages" not in st.session_state:
+        st.session_state.vayu_messages = [{"role": "system", "content": VAYU_SYSTEM_PROMPT}]
+
+
+def _vayu_push(role, msg):
+    """Record one turn in the display history and the Groq-format message list."""
+    st.session_state.vayu_history.append((role, msg))
+    messages = st.session_state.vayu_messages
+    messages.append({"role": "assistant" if role == "vayu" else "user", "content": msg})
+    # System prompt stays at index 0
+    del messages[1:-VAYU_MAX_MESSAGES]
+
+
+# -------------------------------------------------------
+# STATIC MARKUP (built once per process)
+# -------------------------------------------------------
+_VAYU_CSS = """
         <style>
         .nv-card-header {
             font-size: 1.5rem;
@@ -155,28 +186,37 @@ def vayu_chatbot_ui():
             padding: 0 !important;
         }
         </style>
-    """, unsafe_allow_html=True)
+    """
 
-    st.markdown("""
+_VAYU_HEADER = """
         <div class="nv-card-header">VAYU · NoVac AI Chatbot</div>
         <p style="opacity:0.7;margin-bottom:10px;">
             Ask me anything about AQI, pollution, PM2.5, health risks, or city conditions.
         </p>
-    """, unsafe_allow_html=True)
+    """
+
+
+# -------------------------------------------------------
+# CHATBOT UI
+# -------------------------------------------------------
+def vayu_chatbot_ui():
+    # Inject CSS styles + header
+    st.markdown(_VAYU_CSS, unsafe_allow_html=True)
+    st.markdown(_VAYU_HEADER, unsafe_allow_html=True)
 
     # Mini clear button
     _, colB = st.columns([6, 1])
     with colB:
         if st.button("Clear Chat", key="vayu_clear"):
-            st.session_state.vayu_history = []
+            st.session_state.pop("vayu_history", None)
+            st.session_state.pop("vayu_messages", None)
             st.rerun()
 
     # Chat history container with scroll
     chat_container = st.container()
     
     with chat_container:
-        if "vayu_history" not in st.session_state:
-            st.session_state.vayu_history = []
+        _init_chat_state()
 
         # Show history
         for role, msg in st.session_state.vayu_history:
@@ -200,7 +240,7 @@ def vayu_chatbot_ui():
 
     if submitted and user_input.strip():
         # Add user message to history
-        st.session_state.vayu_history.append(("user", user_input))
+        _vayu_push("user", user_input)
 
         # -------------------------------------------------------
         # Detect AQI query + city
@@ -214,13 +254,12 @@ def vayu_chatbot_ui():
         # -------------------------------------------------------
         if is_aqi_query and city:
             try:
-                # Main AQI
-                result, _, _, _ = run_copilot(city, None, [], mock=False)
+                # Main AQI + sub-stations from a single OpenAQ fetch
+                top_pm25, stations = fetch_city_bundle(city, top_n=6)
+                result, _, _, _ = run_copilot(city, None, [], mock=False, current=top_pm25)
 
                 if result is None:
-                    st.session_state.vayu_history.append(
-                        ("vayu", f"⚠️ I couldn't fetch AQI for **{city}**. Please check the city name and try again.")
-                    )
+                    _vayu_push("vayu", f"⚠️ I couldn't fetch AQI for **{city}**. Please check the city name and try again.")
                     st.rerun()
 
                 current = result.get("current", "N/A")
@@ -230,10 +269,8 @@ def vayu_chatbot_ui():
                 forecast = result.get("forecast", [])
                 decision = result.get("decision", {})
 
-                # Sub-stations
-                stations = fetch_city_stations(city)
                 station_text = (
-                    "\n".join([f"- **{s['station']}** → {s['value']}" for s in stations[:6]])
+                    "\n".join([f"- **{s['station']}** → {s['value']}" for s in stations])
                     if stations else "No monitoring stations available."
                 )
 
@@ -261,22 +298,18 @@ def vayu_chatbot_ui():
                 ]
 
                 reply = vayu_llm(messages)
-                st.session_state.vayu_history.append(("vayu", reply))
+                _vayu_push("vayu", reply)
                 st.rerun()
 
             except Exception as e:
                 error_msg = f"⚠️ Error fetching AQI data: {str(e)}"
-                st.session_state.vayu_history.append(("vayu", error_msg))
+                _vayu_push("vayu", error_msg)
                 st.rerun()
 
         # -------------------------------------------------------
         # NORMAL CHAT MODE
         # -------------------------------------------------------
         else:
-            messages = [{"role": "system", "content": VAYU_SYSTEM_PROMPT}]
-            for role, msg in st.session_state.vayu_history:
-                messages.append({"role": "assistant" if role == "vayu" else "user", "content": msg})
-
-            reply = vayu_llm(messages)
-            st.session_state.vayu_history.append(("vayu", reply))
+            reply = vayu_llm(st.session_state.vayu_messages)
+            _vayu_push("vayu", reply)
             st.rerun()
\ No newline at end of file
@@ -1,38 +1,25 @@
 import folium
+import numpy as np
 from folium.plugins import HeatMap
-from streamlit_folium import st_folium
+import streamlit as st
+import streamlit.components.v1 as components
 
 from aqi import fetch_city_stations
 
 # -------------------------------------------------------
 # CREATE AQI HEATMAP OF A CITY
 # -------------------------------------------------------
-def generate_aqi_heatmap(city):
-    stations = fetch_city_stations(city)
-
-    if not stations:
-        return None, "No AQI station data available for this city."
-
-    # Extract lat/long/value for heatmap points
-    heat_data = []
-    center_lat = 0
-    center_lon = 0
-
-    for s in stations:
-        try:
-            lat = s["lat"]
-            lon = s["lon"]
-            val = s["value"]  # PM2.5
-            heat_data.append([lat, lon, max(val, 20)])  # minimum intensity 20
-
-            center_lat += lat
-            center_lon += lon
-        except:
-            continue
+def _build_map(stations):
+    # Extract lat/long/value for heatmap points (stations arrive already
+    # filtered to rows with coordinates); minimum intensity 20
+    coords = np.array(
+        [(s["lat"], s["lon"], max(s["value"], 20)) for s in stations],
+        dtype=np.float64,
+    )
+    heat_data = coords.tolist()
 
     # Center map
-    center_lat /= len(heat_data)
-    center_lon /= len(heat_data)
+    center_lat, center_lon = coords[:, :2].mean(axis=0)
 
     # Folium map
     m = folium.Map(
@@ -61,7 +48,13 @@ def generate_aqi_heatmap(city):
             popup=f"{s['station']} — PM2.5: {s['value']}",
         ).add_to(m)
 
-    return m, "OK"
+    return m
+
+
+# Rendered page cached by station data, so unrelated reruns skip folium
+@st.cache_data(ttl=300, show_spinner=False)
+def _build_map_html(stations):
+    return _build_map(stations).get_root().render()
 
 
 # -------------------------------------------------------
@@ -69,14 +62,13 @@ def generate_aqi_heatmap(city):
 # -------------------------------------------------------
 def heatmap_ui(city):
     st_header = f"🌍 **{city} — Real-Time AQI Heatmap**"
-    import streamlit as st
 
     st.subheader(st_header)
 
-    m, status = generate_aqi_heatmap(city)
+    stations = fetch_city_stations(city)
 
-    if m is None:
-        st.warning(status)
+    if not stations:
+        st.warning("No AQI station data available for this city.")
         return
 
-    st_folium(m, width=800, height=550)
+    components.html(_build_map_html(stations), width=800, height=550)
@@ -1,12 +1,19 @@
 import requests
+import aiohttp
+import asyncio
+import orjson
 import folium
 import random
 from folium.plugins import HeatMap
-from streamlit_folium import st_folium
 import streamlit as st
+import streamlit.components.v1 as components
 
+from aqi import HTTP_TIMEOUT, fetch_json, make_http_session
 from chatbot import vayu_chatbot_ui
 
+# Geocoding goes through requests; the pollution grid through fetch_json
+_SESSION = make_http_session()
+
 
 # ---------------------------
 # GET CITY COORDS
@@ -15,8 +22,8 @@ def get_city_coordinates(city, api_key):
     url = f"http://api.openweathermap.org/geo/1.0/direct?q={city}&limit=1&appid={api_key}"
 
     try:
-        r = requests.get(url, timeout=10).json()
-    except Exception:
+        r = orjson.loads(_SESSION.get(url, timeout=HTTP_TIMEOUT).content)
+    except (requests.exceptions.RequestException, ValueError):
         return None, None
 
     # Check API returned valid array
@@ -35,12 +42,12 @@ def get_city_coordinates(city, api_key):
 # ---------------------------
 # GET POLLUTION DATA
 # ---------------------------
-def get_pollution(lat, lon, api_key):
+async def get_pollution(session, lat, lon, api_key):
     url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={api_key}"
 
     try:
-        r = requests.get(url, timeout=10).json()
-    except Exception:
+        r = await fetch_json(session, url)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
         return None
 
     if "list" not in r or not r["list"]:
@@ -54,6 +61,15 @@ def get_pollution(lat, lon, api_key):
     }
 
 
+async def _gather_pollution(grid, api_key):
+    # One event loop + one connection pool for every grid point
+    connector = aiohttp.TCPConnector(limit=16, limit_per_host=16, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(
+            *(get_pollution(session, glat, glon, api_key) for glat, glon in grid)
+        )
+
+
 # ---------------------------
 # CACHE HEATMAP DATA
 # ---------------------------
@@ -66,30 +82,54 @@ def fetch_heatmap_points(city, api_key):
     if lat is None or lon is None:
         return None, None, [], [], []
 
-    # Generate grid
-    offsets = [-0.1, 0, 0.1]
+    # Sample a cross (center + 4 cardinals); the HeatMap blur smears the
+    # corners of a full 3x3 grid together anyway
+    offsets = [(0, 0), (0.1, 0), (-0.1, 0), (0, 0.1), (0, -0.1)]
 
     pm25_points = []
     pm10_points = []
     no2_points = []
 
-    for dx in offsets:
-        for dy in offsets:
-            glat = lat + dx + random.uniform(-0.01, 0.01)
-            glon = lon + dy + random.uniform(-0.01, 0.01)
+    grid = [
+        (lat + dx + random.uniform(-0.01, 0.01), lon + dy + random.uniform(-0.01, 0.01))
+        for dx, dy in offsets
+    ]
+
+    # Fetch all grid points concurrently (results come back in grid order)
+    results = asyncio.run(_gather_pollution(grid, api_key))
 
-            pol = get_pollution(glat, glon, api_key)
-            if pol is None:
-                continue
+    for (glat, glon), pol in zip(grid, results):
+        if pol is None:
+            continue
 
-            pm25_points.append([glat, glon, pol["pm25"]])
-            pm10_points.append([glat, glon, pol["pm10"]])
-            no2_points.append([glat, glon, pol["no2"]])
+        pm25_points.append([glat, glon, pol["pm25"]])
+        pm10_points.append([glat, glon, pol["pm10"]])
+        no2_points.append([glat, glon, pol["no2"]])
 
     # Return EXACT 5-tuple every time
     return lat, lon, pm25_points, pm10_points, no2_points
 
 
+# ---------------------------
+# RENDER MAP (cached HTML)
+# ---------------------------
+@st.cache_data(ttl=300, show_spinner=False)
+def _build_map_html(lat, lon, pm25, pm10, no2):
+    # Keyed on the point data, so reruns from unrelated widgets skip folium
+    m = folium.Map(location=[lat, lon], zoom_start=11, tiles="cartodbpositron")
+
+    if pm25:
+        HeatMap(pm25, radius=30, blur=20, min_opacity=0.3, name="PM2.5").add_to(m)
+    if pm10:
+        HeatMap(pm10, radius=25, blur=18, min_opacity=0.25, name="PM10").add_to(m)
+    if no2:
+        HeatMap(no2, radius=20, blur=15, min_opacity=0.2, name="NO₂").add_to(m)
+
+    folium.LayerControl().add_to(m)
+
+    return m.get_root().render()
+
+
 # ---------------------------
 # HEATMAP UI
 # ---------------------------
@@ -106,18 +146,7 @@ def heatmap_ui_openweather(city):
         return
 
     # Folium map
-    m = folium.Map(location=[lat, lon], zoom_start=11, tiles="cartodbpositron")
-
-    if pm25:
-        HeatMap(pm25, radius=30, blur=20, min_opacity=0.3, name="PM2.5").add_to(m)
-    if pm10:
-        HeatMap(pm10, radius=25, blur=18, min_opacity=0.25, name="PM10").add_to(m)
-    if no2:
-        HeatMap(no2, radius=20, blur=15, min_opacity=0.2, name="NO₂").add_to(m)
-
-    folium.LayerControl().add_to(m)
-
-    st_folium(m, width=900, height=550, returned_objects=[])
+    components.html(_build_map_html(lat, lon, pm25, pm10, no2), width=900, height=550)
 
     st.markdown("---")
     st.subheader("🤖 VAYU GPT — Ask About Your City's Air Quality")
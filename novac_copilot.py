@@ -4,56 +4,99 @@
 # -------------------------------------------------------
 
 import streamlit as st
-import pandas as pd
+import numpy as np
+import orjson
 import requests
 import random
 import os
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from groq import Groq
 from dotenv import load_dotenv
 
+from aqi import HTTP_TIMEOUT, make_http_session
+
 load_dotenv()  # load .env if available
 
+# Session for OpenAQ + Graph API calls, built once per process (this script
+# re-executes on every rerun, so a module-level session would be rebuilt)
+@st.cache_resource
+def get_http_session():
+    return make_http_session()
+
 
 # ===========================
 # FREE AI AGENT (Groq Llama 3)
 # ===========================
+@st.cache_resource
+def get_groq_client():
+    """Groq client built once and shared by every rerun of this script."""
+    return Groq(api_key=os.getenv("GROQ_API_KEY") or st.secrets["groq_api_key"])
+
+
+# Similar AQI states share one LLM answer; failures raise, so they are never cached
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def _cached_ai(aqi, trend, spike, spike_change, forecast):
+    client = get_groq_client()
+
+    prompt = f"""
+    You are NoVac AI — an environmental intelligence agent.
+    Analyze the following air quality data and give a smart, concise, 
+    human-friendly explanation with actionable advice.
+
+    Current PM2.5: {aqi}
+    Trend direction: {trend}
+    Spike detected: {spike}
+    Spike jump: {spike_change}
+    Forecast (3 days): {list(forecast)}
+
+    Provide:
+    - A short summary in one sentence
+    - Health risk level
+    - Who should be most careful
+    - Whether people should stay indoors
+    - Any actionable recommendations
+    - Confidence level in your analysis
+    """
+
+    response = client.chat.completions.create(
+        model="llama-3.1-8b-instant",
+        messages=[{"role": "user", "content": prompt}]
+    )
+
+    return response.choices[0].message.content
+
+
 def ai_agent_analysis(aqi, trend, spike, spike_change, forecast):
     """Generate agent-style explanation using Groq free Llama 3."""
     try:
-        api_key = os.getenv("GROQ_API_KEY") or st.secrets["groq_api_key"]
-        client = Groq(api_key=api_key)
-
-        prompt = f"""
-        You are NoVac AI — an environmental intelligence agent.
-        Analyze the following air quality data and give a smart, concise, 
-        human-friendly explanation with actionable advice.
-
-        Current PM2.5: {aqi}
-        Trend direction: {trend}
-        Spike detected: {spike}
-        Spike jump: {spike_change}
-        Forecast (3 days): {forecast}
-
-        Provide:
-        - A short summary in one sentence
-        - Health risk level
-        - Who should be most careful
-        - Whether people should stay indoors
-        - Any actionable recommendations
-        - Confidence level in your analysis
-        """
-
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[{"role": "user", "content": prompt}]
+        return _cached_ai(
+            round(float(aqi), 1),
+            trend,
+            spike,
+            round(float(spike_change), 1),
+            tuple(round(float(f), 1) for f in forecast),
         )
 
-        return response.choices[0].message.content
-
     except Exception as e:
         return f"AI agent unavailable: {e}"
 
 
+# Worker threads shared by every session in the process, so they are sized
+# for concurrent users rather than one: the LLM call overlaps chart rendering
+# (one in flight per session), and the WhatsApp POSTs get their own pool so
+# an alert never waits behind other users' Groq calls
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=32, thread_name_prefix="novac-ai")
+
+
+@st.cache_resource
+def get_alert_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="novac-wa")
+
+
 # ===========================
 # WHATSAPP ALERTS (Cloud API)
 # ===========================
@@ -84,7 +127,7 @@ def send_whatsapp_alert(text: str):
     }
 
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=10)
+        resp = get_http_session().post(url, json=payload, headers=headers, timeout=10)
         data = resp.json()
         if resp.status_code == 200 and "messages" in data:
             return True, "Sent"
@@ -99,7 +142,18 @@ def send_whatsapp_alert(text: str):
 def fetch_current_aqi(city, mock=False):
     if mock:
         return random.randint(50, 250)
+    try:
+        # Whitespace only: OpenAQ location names are case-sensitive
+        return _cached_fetch(" ".join(city.split()))
+    except LookupError:
+        return None
+
 
+# Cached per normalized city: repeat runs within a minute skip the network.
+# Misses raise instead, so "no data" is never cached and the next run retries.
+# Mock readings bypass the cache so they keep varying between runs.
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_fetch(city):
     url = "https://api.openaq.org/v2/latest"
 
     params = {
@@ -111,32 +165,35 @@ def fetch_current_aqi(city, mock=False):
         "location": city  # ★ KEY FIX → works for ANY town / village / city
     }
 
+    session = get_http_session()
+
     try:
-        r = requests.get(url, params=params, timeout=10)
-        data = r.json()
+        r = session.get(url, params=params, timeout=HTTP_TIMEOUT)
+        data = orjson.loads(r.content)
 
         # Fallback: try as city field if no data
-        if len(data["results"]) == 0:
+        if not data.get("results"):
             params.pop("location", None)
             params["city"] = city
-            r = requests.get(url, params=params, timeout=10)
-            data = r.json()
+            r = session.get(url, params=params, timeout=HTTP_TIMEOUT)
+            data = orjson.loads(r.content)
 
-        if len(data["results"]) == 0:
-            return None
+        if not data.get("results"):
+            raise LookupError(f"no OpenAQ results for {city!r}")
 
         # Some locations store pm2.5 under "measurements", some under "parameters"
-        try:
-            return data["results"][0]["measurements"][0]["value"]
-        except:
-            for p in data["results"][0].get("parameters", []):
-                if p["parameter"] == "pm25":
-                    return p["lastValue"]
+        station = data["results"][0]
+        measurements = station.get("measurements") or []
+        if measurements:
+            return measurements[0].get("value")
+        for p in station.get("parameters") or []:
+            if p.get("parameter") == "pm25":
+                return p.get("lastValue")
 
-        return None
+    except (requests.exceptions.RequestException, ValueError) as e:
+        raise LookupError(f"OpenAQ lookup failed for {city!r}") from e
 
-    except:
-        return None
+    raise LookupError(f"no PM2.5 reading for {city!r}")
 
 
 
@@ -156,8 +213,8 @@ def detect_spike(current, last, threshold=40):
 def trend_direction(history, window=5):
     if len(history) < window:
         return "stable"
-    recent = history[-window:]
-    slope = recent[-1] - recent[0]
+    arr = np.asarray(history)
+    slope = arr[-1] - arr[-window]
     if slope > 15:
         return "up"
     elif slope < -15:
@@ -172,72 +229,28 @@ def forecast_pm25(history, days=3):
     if len(history) < 2:
         return [history[-1]] * days
 
-    last = history[-1]
-    prev = history[-2]
-    slope = last - prev  # direction
-
-    forecast = []
-    value = last
-
-    for _ in range(days):
-        # Trend influences
-        if slope > 10:
-            value += random.uniform(5, 12)   # rising pollution
-        elif slope < -10:
-            value -= random.uniform(5, 12)   # improving
-        else:
-            value += random.uniform(-4, 4)   # small variation
+    arr = np.asarray(history, dtype=float)
+    last = arr[-1]
+    slope = last - arr[-2]  # direction
 
-        # Keep inside normal bounds
-        value = max(5, min(value, 400))
-        forecast.append(round(value, 2))
+    # Trend influences the per-day step range
+    if slope > 10:
+        low, high = 5, 12      # rising pollution
+    elif slope < -10:
+        low, high = -12, -5    # improving
+    else:
+        low, high = -4, 4      # small variation
 
-    return forecast
+    # All days drawn at once, accumulated and kept inside normal bounds
+    forecast = np.clip(last + np.random.uniform(low, high, size=days).cumsum(), 5, 400)
+    return np.round(forecast, 2).tolist()
 
 
 # ===========================
 # DECISION ENGINE
 # ===========================
-def copilot_decision(aqi, last_aqi, trend, spike, spike_change):
-    if spike:
-        return {
-            "status": "Spike Detected",
-            "severity": "High",
-            "action": "ALERT",
-            "details": f"PM2.5 jumped by {spike_change}.",
-            "risk": "High"
-        }
-    if aqi >= 200:
-        return {
-            "status": "Very Unhealthy",
-            "severity": "High",
-            "action": "WARNING",
-            "details": "Hazardous levels.",
-            "risk": "High"
-        }
-    if aqi >= 150:
-        return {
-            "status": "Unhealthy",
-            "severity": "Medium",
-            "action": "CAUTION",
-            "details": "Air quality harmful.",
-            "risk": "Medium"
-        }
-    if trend == "up":
-        return {
-            "status": "Rising Pollution",
-            "severity": "Low",
-            "action": "MONITOR",
-            "details": "Slow rise detected.",
-            "risk": "Low"
-        }
-    return {
-        "status": "Normal",
-        "severity": "Low",
-        "action": "NONE",
-        "details": "Air quality acceptable.",
-        "risk": "Low"
-    }
+# One outcome table for both copilots lives in spike.py
+from spike import copilot_decision
 
 
 # ===========================
@@ -262,21 +275,102 @@ def run_copilot(city, last_aqi, history, mock=False):
         "spike_change": spike_change,
         "decision": decision,
         "forecast": forecast,
-        "history": history[-20:]
+        "history": list(history)
     }, "OK", current, history
 
 
+# ===========================
+# FORECAST CHART SPEC
+# ===========================
+# Forecast chart spec minus the per-run data/domain. Built once per process
+# (this script re-executes on every rerun) and never mutated: _neon_spec
+# copies only the subtrees it patches.
+@st.cache_resource
+def _neon_base():
+    return {
+        "width": "container",
+        "height": 260,
+        "background": None,
+        "data": {"values": []},
+        "mark": {
+            "type": "line",
+            "point": {"filled": True, "size": 80, "color": "#3bffb3"},
+            "strokeWidth": 4,
+            "color": "#ff4dd8",
+            "aria": False
+        },
+        "encoding": {
+            "x": {
+                "field": "Day",
+                "type": "nominal",
+                "axis": {
+                    "labelColor": "#ccc",
+                    "labelAngle": 0
+                }
+            },
+            "y": {
+                "field": "PM2.5",
+                "type": "quantitative",
+                "scale": {
+                    "domain": [0, 0]
+                },
+                "axis": {
+                    "title": "PM2.5 Forecast",
+                    "labelColor": "#ccc",
+                    "gridColor": "rgba(255,255,255,0.12)"
+                }
+            }
+        },
+        "config": {
+            # No ARIA description strings generated per mark
+            "mark": {"aria": False},
+            "view": {"stroke": "transparent"},
+            "axis": {
+                "domainColor": "#666",
+                "tickColor": "#777"
+            }
+        }
+    }
+
+
+def _neon_spec(records, lo, hi):
+    base = _neon_base()
+    y = dict(base["encoding"]["y"], scale={"domain": [lo, hi]})
+    return dict(
+        base,
+        data={"values": records},
+        encoding=dict(base["encoding"], y=y),
+    )
+
+
 # ===========================
 # UI HELPERS (CSS + PARTICLES)
 # ===========================
-def load_css():
-    with open("style.css") as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+@contextmanager
+def nv_card(title):
+    # Card wrapper + header in one element instead of two
+    st.markdown(
+        f'<div class="nv-card"><div class="nv-card-header">{title}</div>',
+        unsafe_allow_html=True,
+    )
+    yield
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
+# Read once per process; the mtime argument is part of the cache key,
+# so editing an asset picks up the new content on the next rerun
+@st.cache_data(show_spinner=False)
+def _read_file(path, mtime):
+    with open(path) as f:
+        return f.read()
 
 
-def load_particles():
-    with open("particles.html") as f:
-        st.markdown(f.read(), unsafe_allow_html=True)
+def load_theme():
+    # CSS + particle layer go out as one element per rerun. They must be
+    # re-emitted every time: Streamlit drops elements a rerun doesn't send.
+    css = _read_file("style.css", os.path.getmtime("style.css"))
+    particles = _read_file("particles.html", os.path.getmtime("particles.html"))
+    st.markdown(f"<style>{css}</style>{particles}", unsafe_allow_html=True)
 
 
 # -------------------------------------------------------
@@ -286,8 +380,7 @@ def load_particles():
 st.set_page_config(page_title="NoVac Copilot", layout="wide")
 
 # Load CSS + particle layer
-load_css()
-load_particles()
+load_theme()
 
 # ---- Title row ----
 st.markdown(
@@ -315,8 +408,9 @@ st.caption("Real-time AQI brain with dual-tone neon UI, Groq LLM insights, and W
 if "last_aqi" not in st.session_state:
     st.session_state.last_aqi = None
 
+# Ring buffer: O(1) append, only the last 20 readings are ever used
 if "history" not in st.session_state:
-    st.session_state.history = []
+    st.session_state.history = deque(maxlen=20)
 
 
 # Sidebar
@@ -329,198 +423,173 @@ whatsapp_enabled = st.sidebar.toggle("Enable WhatsApp Alerts", value=False)
 st.sidebar.write("Mock Mode recommended for testing & demos.")
 
 # Dashboard header / run button
+def _request_run():
+    st.session_state.trigger_generation = True
+
+
 top_bar = st.container()
 with top_bar:
     col_run, col_status = st.columns([1, 2])
     with col_run:
-        run_clicked = st.button("Run Analysis Now")
+        st.button("Run Analysis Now", on_click=_request_run)
     with col_status:
         st.markdown(
             '<div class="nv-card nv-card-header">Copilot Status • Live Decision Space</div>',
             unsafe_allow_html=True,
         )
 
-trigger_run = auto_mode or run_clicked
-
-if trigger_run:
 
-    result, status, new_last, new_history = run_copilot(
-        city,
-        st.session_state.last_aqi,
-        st.session_state.history,
-        mock=mock_mode
-    )
+# Fetch + LLM only run when generation is requested (Run clicked, or a full
+# script run in Autonomous Mode); any other rerun (sidebar toggles, fragment
+# reruns such as the table toggle) redraws the last result from session state
+@st.fragment
+def render_analysis(city, mock_mode, whatsapp_enabled, auto_mode):
+    full_run = st.session_state.pop("nv_full_run", False)
+    fresh = st.session_state.pop("trigger_generation", False) or (auto_mode and full_run)
+
+    if fresh:
+        result, status, new_last, new_history = run_copilot(
+            city,
+            st.session_state.last_aqi,
+            st.session_state.history,
+            mock=mock_mode
+        )
 
-    if result:
+        if not result:
+            st.error("API Error! Try enabling Mock Mode.")
+            return
 
         st.session_state.last_aqi = new_last
         st.session_state.history = new_history
+        st.session_state.last_result = {"result": result, "ai_text": None}
+
+    elif "last_result" not in st.session_state:
+        st.info("Click **Run Analysis Now** or enable **Autonomous Mode** to wake the Copilot.")
+        return
+
+    last = st.session_state.last_result
+    result = last["result"]
+
+    # Start the LLM call now so it runs while the cards and chart render
+    ai_future = None
+    if last["ai_text"] is None:
+        ai_future = get_executor().submit(
+            ai_agent_analysis,
+            result["current"],
+            result["trend"],
+            result["spike"],
+            result["spike_change"],
+            result["forecast"]
+        )
 
-        dec = result["decision"]
-
-        # ==== Top dashboard row: METRIC / ALERTS / FORECAST ====
-        col_a, col_b, col_c = st.columns([1.2, 1.1, 1.2])
-
-        with col_a:
-            st.markdown('<div class="nv-card">', unsafe_allow_html=True)
-            st.markdown('<div class="nv-card-header">Current Load</div>', unsafe_allow_html=True)
-            st.metric("PM2.5 (µg/m³)", result["current"])
-            trend_label = {
-                "up": "📈 Rising",
-                "down": "📉 Dropping",
-                "stable": "➖ Stable"
-            }[result["trend"]]
-            st.markdown(f"**Trend:** {trend_label}")
-            st.markdown("</div>", unsafe_allow_html=True)
-
-        with col_b:
-            st.markdown('<div class="nv-card">', unsafe_allow_html=True)
-            st.markdown('<div class="nv-card-header">System Alerts</div>', unsafe_allow_html=True)
-            if result["spike"]:
-                st.error(f"⚠️ Spike Detected (+{result['spike_change']})")
-            else:
-                st.info("No sudden spike detected in latest reading.")
-            if dec["severity"] == "High":
-                st.error(f"{dec['status']} — {dec['details']}")
-            elif dec["severity"] == "Medium":
-                st.warning(f"{dec['status']} — {dec['details']}")
-            else:
-                st.success(f"{dec['status']} — {dec['details']}")
-            st.markdown("</div>", unsafe_allow_html=True)
+    dec = result["decision"]
 
-        with col_c:
-            st.markdown('<div class="nv-card">', unsafe_allow_html=True)
-            st.markdown('<div class="nv-card-header">3-Day Forecast</div>', unsafe_allow_html=True)
+    # ==== Top dashboard row: METRIC / ALERTS / FORECAST ====
+    col_a, col_b, col_c = st.columns([1.2, 1.1, 1.2])
 
-            forecast_df = pd.DataFrame(
-        {
-            "Day": ["Day 1", "Day 2", "Day 3"],
-            "PM2.5": result["forecast"]
-        }
-    )
-            forecast_df["X"] = [1, 2, 3]
-
-            neon_chart = {
-    "width": "container",
-    "height": 260,
-    "background": None,
-    "data": {"values": forecast_df.to_dict(orient="records")},
-    "mark": {
-        "type": "line",
-        "point": {"filled": True, "size": 80, "color": "#3bffb3"},
-        "strokeWidth": 4,
-        "color": "#ff4dd8"
-    },
-    "encoding": {
-        "x": {
-            "field": "Day",
-            "type": "nominal",
-            "axis": {
-                "labelColor": "#ccc",
-                "labelAngle": 0
-            }
-        },
-        "y": {
-            "field": "PM2.5",
-            "type": "quantitative",
-            "scale": {
-                "domain": [
-                    float(forecast_df["PM2.5"].min()) - 20,
-                    float(forecast_df["PM2.5"].max()) + 20
-                ]
-            },
-            "axis": {
-                "title": "PM2.5 Forecast",
-                "labelColor": "#ccc",
-                "gridColor": "rgba(255,255,255,0.12)"
-            }
-        }
-    },
-    "config": {
-        "view": {"stroke": "transparent"},
-        "axis": {
-            "domainColor": "#666",
-            "tickColor": "#777"
-        }
-    }
-}
+    with col_a, nv_card("Current Load"):
+        st.metric("PM2.5 (µg/m³)", result["current"])
+        trend_label = {
+            "up": "📈 Rising",
+            "down": "📉 Dropping",
+            "stable": "➖ Stable"
+        }[result["trend"]]
+        st.markdown(f"**Trend:** {trend_label}")
+
+    with col_b, nv_card("System Alerts"):
+        if result["spike"]:
+            st.error(f"⚠️ Spike Detected (+{result['spike_change']})")
+        else:
+            st.info("No sudden spike detected in latest reading.")
+        if dec["severity"] == "High":
+            st.error(f"{dec['status']} — {dec['details']}")
+        elif dec["severity"] == "Medium":
+            st.warning(f"{dec['status']} — {dec['details']}")
+        else:
+            st.success(f"{dec['status']} — {dec['details']}")
 
+    with col_c, nv_card("3-Day Forecast"):
+        # Three rows: plain records + domain, no DataFrame round-trip
+        forecast = result["forecast"]
+        records = [
+            {"Day": f"Day {i + 1}", "PM2.5": v, "X": i + 1}
+            for i, v in enumerate(forecast)
+        ]
+        lo, hi = float(min(forecast)) - 20, float(max(forecast)) + 20
 
-        st.vega_lite_chart(neon_chart, use_container_width=True)
+        neon_chart = _neon_spec(records, lo, hi)
 
-        
-        st.table(forecast_df[["Day", "PM2.5"]])
+    st.vega_lite_chart(neon_chart, use_container_width=True)
 
-        st.markdown("</div>", unsafe_allow_html=True)
-        # ==== AI Insight + Trend (2nd row) ====
-        col_ai, col_trend = st.columns([1.35, 1])
+    # Same three rows as the chart; only serialized and shipped when asked for
+    if st.toggle("Show forecast table", value=False, key="nv_show_table"):
+        st.table([{"Day": r["Day"], "PM2.5": r["PM2.5"]} for r in records])
 
-        with col_ai:
-            st.markdown('<div class="nv-card">', unsafe_allow_html=True)
-            st.markdown('<div class="nv-card-header">NoVac AI Copilot Insight</div>', unsafe_allow_html=True)
-            st.markdown(
-                '<div class="ai-thinking"><div class="ai-dot"></div><span>Copilot is analyzing live data...</span></div><br><br>',
-                unsafe_allow_html=True,
-            )
+    # ==== AI Insight + Trend (2nd row) ====
+    col_ai, col_trend = st.columns([1.35, 1])
+
+    with col_ai, nv_card("NoVac AI Copilot Insight"):
+        st.markdown(
+            '<div class="ai-thinking"><div class="ai-dot"></div><span>Copilot is analyzing live data...</span></div><br><br>',
+            unsafe_allow_html=True,
+        )
+        ai_text = last["ai_text"]
+        if ai_future is not None:
             with st.spinner("🧠 Thinking like an environmental expert..."):
-                ai_text = ai_agent_analysis(
-                    result["current"],
-                    result["trend"],
-                    result["spike"],
-                    result["spike_change"],
-                    result["forecast"]
-                )
-            st.write(ai_text)
-            st.markdown("</div>", unsafe_allow_html=True)
-
-        with col_trend:
-            st.markdown('<div class="nv-card">', unsafe_allow_html=True)
-            st.markdown('<div class="nv-card-header">Recent PM2.5 Trajectory</div>', unsafe_allow_html=True)
-            st.line_chart(result["history"])
-            st.markdown("</div>", unsafe_allow_html=True)
-
-        # ===========================
-        # WHATSAPP SMART ALERT LOGIC
-        # ===========================
-        # Only send alerts on manual runs (not in auto_mode)
-        if whatsapp_enabled and not auto_mode:
-            aqi_val = float(result["current"])
-            reasons = []
-
-            if result["spike"]:
-                reasons.append("Spike detected")
-            if aqi_val >= 200:
-                reasons.append("Very unhealthy AQI")
-            elif aqi_val >= 150:
-                reasons.append("Unhealthy AQI")
-
-            should_alert = len(reasons) > 0
-
-            if should_alert:
-                reasons_str = ", ".join(reasons)
-                short_alert = (
-                    f"🩷 NoVac AQI Alert for {city}:\n"
-                    f"PM2.5: {aqi_val:.1f}\n"
-                    f"Status: {dec['status']}\n"
-                    f"Trend: {result['trend']}\n"
-                    f"Reason: {reasons_str}"
-                )
-
-                ok, msg = send_whatsapp_alert(short_alert)
-                if ok:
-                    st.success("WhatsApp alert sent (summary).")
-                else:
-                    st.warning(f"WhatsApp alert failed: {msg}")
-
-                # Second message: LLM explanation
-                if ai_text and not ai_text.startswith("AI agent unavailable"):
-                    long_msg = f"🧠 NoVac Copilot insight for {city}:\n{ai_text}"
-                    if len(long_msg) > 3900:
-                        long_msg = long_msg[:3900] + "..."
-                    send_whatsapp_alert(long_msg)
+                ai_text = ai_future.result()
+            last["ai_text"] = ai_text
+        st.write(ai_text)
+
+    with col_trend, nv_card("Recent PM2.5 Trajectory"):
+        st.line_chart(result["history"])
+
+    # ===========================
+    # WHATSAPP SMART ALERT LOGIC
+    # ===========================
+    # Only send alerts on fresh manual runs (not in auto_mode, not on redraws)
+    if fresh and whatsapp_enabled and not auto_mode:
+        aqi_val = float(result["current"])
+        reasons = (
+            ("Spike detected", result["spike"]),
+            ("Very unhealthy AQI", aqi_val >= 200),
+            ("Unhealthy AQI", 150 <= aqi_val < 200),
+        )
+        reasons_str = ", ".join(text for text, hit in reasons if hit)
+
+        should_alert = bool(reasons_str)
+
+        if should_alert:
+            short_alert = (
+                f"🩷 NoVac AQI Alert for {city}:\n"
+                f"PM2.5: {aqi_val:.1f}\n"
+                f"Status: {dec['status']}\n"
+                f"Trend: {result['trend']}\n"
+                f"Reason: {reasons_str}"
+            )
+
+            # Second message: LLM explanation
+            long_msg = None
+            if ai_text and not ai_text.startswith("AI agent unavailable"):
+                # Truncate the insight against the space left after the prefix
+                prefix = f"🧠 NoVac Copilot insight for {city}:\n"
+                budget = 3900 - len(prefix)
+                long_msg = prefix + (ai_text if len(ai_text) <= budget else ai_text[:budget - 3] + "...")
+
+            # Both POSTs in flight at once instead of back to back
+            executor = get_alert_executor()
+            f1 = executor.submit(send_whatsapp_alert, short_alert)
+            f2 = executor.submit(send_whatsapp_alert, long_msg) if long_msg else None
+            ok, msg = f1.result()
+            if f2 is not None:
+                f2.result()
+
+            if ok:
+                st.success("WhatsApp alert sent (summary).")
+            else:
+                st.warning(f"WhatsApp alert failed: {msg}")
+
 
-    else:
-        st.error("API Error! Try enabling Mock Mode.")
 
-else:
-    st.info("Click **Run Analysis Now** or enable **Autonomous Mode** to wake the Copilot.")
+# Set only here, so a fragment-only rerun can tell it is not a full script run
+st.session_state.nv_full_run = True
+render_analysis(city, mock_mode, whatsapp_enabled, auto_mode)
@@ -1,7 +1,11 @@
-import random
+import numpy as np
+from numba import njit
 from aqi import fetch_current_aqi
    # adjust import if needed
 
+# Only the last 20 readings are ever shown; trend/forecast need fewer
+HISTORY_LEN = 20
+
 def detect_spike(current, last, threshold=40):
     if last is None:
         return False, 0
@@ -12,8 +16,8 @@ def detect_spike(current, last, threshold=40):
 def trend_direction(history, window=5):
     if len(history) < window:
         return "stable"
-    recent = history[-window:]
-    slope = recent[-1] - recent[0]
+    arr = np.asarray(history)
+    slope = arr[-1] - arr[-window]
     if slope > 15:
         return "up"
     elif slope < -15:
@@ -21,29 +25,71 @@ def trend_direction(history, window=5):
     return "stable"
 
 
-def forecast_pm25(history, days=3):
-    if len(history) < 2:
-        return [history[-1]] * days
-
-    last = history[-1]
-    prev = history[-2]
-    slope = last - prev  # direction
+@njit(cache=True)
+def _forecast_kernel(last, slope, days, noise):
+    # noise is uniform [0, 1); each day maps it onto the slope's step range
+    if slope > 10:
+        low, high = 5.0, 12.0
+    elif slope < -10:
+        low, high = -12.0, -5.0
+    else:
+        low, high = -4.0, 4.0
 
-    forecast = []
+    out = np.empty(days)
     value = last
+    for i in range(days):
+        value += low + (high - low) * noise[i]
+        value = min(max(value, 5.0), 400.0)
+        out[i] = round(value, 2)
+    return out
 
-    for _ in range(days):
-        if slope > 10:
-            value += random.uniform(5, 12)
-        elif slope < -10:
-            value -= random.uniform(5, 12)
-        else:
-            value += random.uniform(-4, 4)
-
-        value = max(5, min(value, 400))
-        forecast.append(round(value, 2))
 
-    return forecast
+def forecast_pm25(history, days=3):
+    arr = np.asarray(history, dtype=np.float64)
+    if len(arr) < 2:
+        return [arr[-1].item()] * days
+
+    last = arr[-1]
+    slope = last - arr[-2]  # direction
+
+    # Random draws stay in NumPy; the stepping loop runs as native code
+    noise = np.random.uniform(0.0, 1.0, days)
+    return _forecast_kernel(last, slope, days, noise).tolist()
+
+
+# Static outcomes built once and handed out as-is, so a decision costs no
+# allocation; callers share these dicts and must treat them as read-only.
+# Only the spike case has a per-call field
+_DEC_TABLE = {
+    "very_unhealthy": {
+        "status": "Very Unhealthy",
+        "severity": "High",
+        "action": "WARNING",
+        "details": "Hazardous levels.",
+        "risk": "High",
+    },
+    "unhealthy": {
+        "status": "Unhealthy",
+        "severity": "Medium",
+        "action": "CAUTION",
+        "details": "Air quality harmful.",
+        "risk": "Medium",
+    },
+    "rising": {
+        "status": "Rising Pollution",
+        "severity": "Low",
+        "action": "MONITOR",
+        "details": "Slow rise detected.",
+        "risk": "Low",
+    },
+    "normal": {
+        "status": "Normal",
+        "severity": "Low",
+        "action": "NONE",
+        "details": "Air quality acceptable.",
+        "risk": "Low",
+    },
+}
 
 
 def copilot_decision(aqi, last_aqi, trend, spike, spike_change):
@@ -56,44 +102,23 @@ def copilot_decision(aqi, last_aqi, trend, spike, spike_change):
             "risk": "High",
         }
     if aqi >= 200:
-        return {
-            "status": "Very Unhealthy",
-            "severity": "High",
-            "action": "WARNING",
-            "details": "Hazardous levels.",
-            "risk": "High",
-        }
+        return _DEC_TABLE["very_unhealthy"]
     if aqi >= 150:
-        return {
-            "status": "Unhealthy",
-            "severity": "Medium",
-            "action": "CAUTION",
-            "details": "Air quality harmful.",
-            "risk": "Medium",
-        }
+        return _DEC_TABLE["unhealthy"]
     if trend == "up":
-        return {
-            "status": "Rising Pollution",
-            "severity": "Low",
-            "action": "MONITOR",
-            "details": "Slow rise detected.",
-            "risk": "Low",
-        }
-    return {
-        "status": "Normal",
-        "severity": "Low",
-        "action": "NONE",
-        "details": "Air quality acceptable.",
-        "risk": "Low",
-    }
+        return _DEC_TABLE["rising"]
+    return _DEC_TABLE["normal"]
 
 
-def run_copilot(city, last_aqi, history, mock=False):
-    current = fetch_current_aqi(city, mock=mock)
+def run_copilot(city, last_aqi, history, mock=False, current=None):
+    # Callers that already hold a (cached) reading can pass it in
+    if current is None:
+        current = fetch_current_aqi(city, mock=mock)
     if current is None:
         return None, "API error", last_aqi, history
 
-    history.append(current)
+    # float32 ndarray capped at HISTORY_LEN instead of an ever-growing list
+    history = np.append(np.asarray(history, dtype=np.float32), np.float32(current))[-HISTORY_LEN:]
 
     spike, spike_change = detect_spike(current, last_aqi)
     trend = trend_direction(history)
@@ -109,7 +134,7 @@ def run_copilot(city, last_aqi, history, mock=False):
             "spike_change": spike_change,
             "decision": decision,
             "forecast": forecast,
-            "history": history[-20:],
+            "history": history,
         },
         "OK",
         current,